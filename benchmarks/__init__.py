@@ -0,0 +1,17 @@
+"""Нагрузочные замеры страниц Yatube на синтетических данных.
+
+Запуск из корня проекта::
+
+    python -m benchmarks.run --posts 100000 --requests 200
+
+Данные создаются в отдельной базе (по умолчанию benchmarks/bench.sqlite3),
+результаты сохраняются в JSON в benchmarks/results/.
+
+Сравнение бэкендов кэша::
+
+    python -m benchmarks.cache --ops 20000 --processes 4
+
+Конкурентная запись и чтение для бэкендов базы::
+
+    python -m benchmarks.concurrency --workers 16 --duration 10
+"""
@@ -0,0 +1,133 @@
+"""Сравнение бэкендов кэша: LocMemCache, DatabaseCache (SQLite) и
+posts.sqlite_cache.SQLiteCache.
+
+Для каждого бэкенда замеряются операции в секунду для get (попадание
+и промах), set, add, incr, get_many и set_many по 20 ключей, а также
+incr из нескольких процессов: счётчик должен сойтись, если бэкенд
+общий для процессов.
+
+    python -m benchmarks.cache --ops 20000 --processes 4
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django(directory):
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "yatube.settings")
+    from django.conf import settings
+    settings.DATABASES["default"]["NAME"] = os.path.join(directory,
+                                                         "db.sqlite3")
+    settings.DEBUG = False
+    settings.CACHES = {
+        "locmem": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "OPTIONS": {"MAX_ENTRIES": 10 ** 6},
+        },
+        "database": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "benchmark_cache",
+            "OPTIONS": {"MAX_ENTRIES": 10 ** 6},
+        },
+        "sqlite": {
+            "BACKEND": "posts.sqlite_cache.SQLiteCache",
+            "LOCATION": os.path.join(directory, "cache.sqlite3"),
+            "OPTIONS": {"MAX_ENTRIES": 10 ** 6},
+        },
+    }
+    settings.CACHES["default"] = settings.CACHES["locmem"]
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command("createcachetable", "benchmark_cache", verbosity=0)
+
+
+def rate(operation, count):
+    started = time.perf_counter()
+    for i in range(count):
+        operation(i)
+    return count / (time.perf_counter() - started)
+
+
+def measure(cache, ops):
+    cache.clear()
+    value = {"text": "x" * 500, "ids": list(range(20))}
+    batch = {f"many:{i}": value for i in range(20)}
+    results = {
+        "set": rate(lambda i: cache.set(f"key:{i}", value), ops),
+        "get hit": rate(lambda i: cache.get(f"key:{i}"), ops),
+        "get miss": rate(lambda i: cache.get(f"missing:{i}"), ops),
+        "add": rate(lambda i: cache.add(f"added:{i}", value), ops),
+    }
+    cache.set("counter", 0)
+    results["incr"] = rate(lambda i: cache.incr("counter"), ops)
+    results["set_many 20"] = rate(lambda i: cache.set_many(batch), ops // 20)
+    results["get_many 20"] = rate(lambda i: cache.get_many(list(batch)),
+                                  ops // 20)
+    return results
+
+
+def increment(alias, times):
+    from django.core.cache import caches
+    from django.db import connections
+    connections.close_all()
+    cache = caches[alias]
+    for _ in range(times):
+        cache.incr("shared")
+
+
+def shared_counter(alias, processes, times):
+    """Итог incr из нескольких процессов (ожидается processes * times)."""
+    from django.core.cache import caches
+    from django.db import connections
+    caches[alias].set("shared", 0)
+    connections.close_all()
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=increment, args=(alias, times))
+               for _ in range(processes)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    return caches[alias].get("shared"), processes * times / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        setup_django(directory)
+        from django.core.cache import caches
+
+        aliases = ("locmem", "database", "sqlite")
+        table = {alias: measure(caches[alias], args.ops)
+                 for alias in aliases}
+        operations = list(table["locmem"])
+        print(f"{'операций/с':<16}" + "".join(f"{a:>12}" for a in aliases))
+        for operation in operations:
+            print(f"{operation:<16}" + "".join(
+                f"{table[alias][operation]:>12.0f}" for alias in aliases
+            ))
+
+        times = max(args.ops // 10 // args.processes, 1)
+        print(f"\nincr из {args.processes} процессов по {times}:")
+        for alias in aliases:
+            total, per_second = shared_counter(alias, args.processes, times)
+            print(f"{alias:<16}итог {total:>8} из "
+                  f"{args.processes * times}, {per_second:>8.0f} операций/с")
+
+
+if __name__ == "__main__":
+    main()
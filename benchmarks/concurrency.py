@@ -0,0 +1,176 @@
+"""Конкурентная нагрузка на базу: пропускная способность записи и
+задержка чтения при многих одновременных процессах.
+
+Каждый процесс в течение --duration секунд в цикле либо пишет (с
+вероятностью --write-share: POST в add_comment или new_post тестовым
+клиентом, со всеми сигналами), либо открывает главную страницу.
+Сравниваются бэкенды: стандартный django.db.backends.sqlite3 и posts.db
+(WAL, pragma, очередь писателей).
+
+    python -m benchmarks.concurrency --workers 16 --duration 10
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENGINES = ("django.db.backends.sqlite3", "posts.db")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--engine", choices=ENGINES, action="append",
+                        help="бэкенд (по умолчанию оба)")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--write-share", type=float, default=0.1)
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--single", action="store_true",
+                        help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def setup_django(engine, directory):
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "yatube.settings")
+    from django.conf import settings
+    database = settings.DATABASES["default"]
+    database["ENGINE"] = engine
+    database["NAME"] = os.path.join(directory, "db.sqlite3")
+    if engine != "posts.db":
+        database["OPTIONS"] = {}
+    settings.CACHES["default"]["LOCATION"] = os.path.join(directory,
+                                                          "cache.sqlite3")
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ["*"]
+    settings.THUMBNAIL_WORKERS = 0
+    import django
+    django.setup()
+
+
+def percentile(values, share):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def worker(deadline, write_share, seed, results):
+    from django.db import connections
+    from django.test import Client
+    from django.urls import reverse
+    from posts.models import Post, User
+
+    rng = random.Random(seed)
+    posts = list(Post.objects.values_list("pk", "author__username")[:1000])
+    client = Client()
+    client.force_login(rng.choice(list(User.objects.all()[:1000])))
+    connections.close_all()
+    reads, writes, errors = [], [], 0
+    while time.time() < deadline:
+        started = time.perf_counter()
+        write = rng.random() < write_share
+        try:
+            if write and rng.random() < 0.2:
+                response = client.post(reverse("new_post"),
+                                       {"text": "нагрузка"})
+            elif write:
+                post_id, username = rng.choice(posts)
+                response = client.post(
+                    reverse("add_comment", args=[username, post_id]),
+                    {"text": "нагрузка"},
+                )
+            else:
+                response = client.get(reverse("index"))
+        except Exception:
+            errors += 1
+            continue
+        if response.status_code >= 400:
+            errors += 1
+            continue
+        (writes if write else reads).append(time.perf_counter() - started)
+    connections.close_all()
+    results.put((reads, writes, errors))
+
+
+def run_single(args):
+    engine = args.engine[0]
+    with tempfile.TemporaryDirectory() as directory:
+        setup_django(engine, directory)
+        from django.core.management import call_command
+        from django.db import connections
+        from benchmarks.dataset import seed
+
+        call_command("migrate", verbosity=0)
+        seed(users=200, groups=10, posts=args.posts, comments=args.posts,
+             follows=1000)
+        connections.close_all()
+
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        deadline = time.time() + args.duration
+        processes = [context.Process(target=worker,
+                                     args=(deadline, args.write_share, i,
+                                           results))
+                     for i in range(args.workers)]
+        for process in processes:
+            process.start()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+    reads = [value for part in collected for value in part[0]]
+    writes = [value for part in collected for value in part[1]]
+    return {
+        "engine": engine,
+        "writes_per_second": len(writes) / args.duration,
+        "reads_per_second": len(reads) / args.duration,
+        "errors": sum(part[2] for part in collected),
+        "read_p50": percentile(reads, 0.5) * 1000,
+        "read_p99": percentile(reads, 0.99) * 1000,
+        "write_p50": percentile(writes, 0.5) * 1000,
+        "write_p99": percentile(writes, 0.99) * 1000,
+        "read_mean": (statistics.mean(reads) * 1000) if reads else 0,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.single:
+        print(json.dumps(run_single(args)))
+        return
+    rows = []
+    for engine in args.engine or ENGINES:
+        # Бэкенд выбирается до django.setup(), поэтому каждый — в своём
+        # процессе
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.concurrency", "--single",
+             "--engine", engine, "--workers", str(args.workers),
+             "--duration", str(args.duration),
+             "--write-share", str(args.write_share),
+             "--posts", str(args.posts)],
+            cwd=BASE_DIR, check=True, capture_output=True, text=True,
+        ).stdout
+        rows.append(json.loads(output.strip().splitlines()[-1]))
+    print(f"{args.workers} процессов, {args.duration:g} с, "
+          f"доля записей {args.write_share:g}")
+    print(f"{'бэкенд':<28}{'записей/с':>10}{'ошибок':>8}"
+          f"{'чтений/с':>10}{'чтение p50':>12}{'p99':>8}"
+          f"{'запись p50':>12}{'p99':>8}  (мс)")
+    for row in rows:
+        print(f"{row['engine']:<28}{row['writes_per_second']:>10.0f}"
+              f"{row['errors']:>8}{row['reads_per_second']:>10.0f}"
+              f"{row['read_p50']:>12.2f}{row['read_p99']:>8.2f}"
+              f"{row['write_p50']:>12.2f}{row['write_p99']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+import io
+
+from django.core.management import call_command
+
+
+def seed(users, groups, posts, comments, follows, rng_seed=0):
+    """Заполняет пустую базу командой generate_data."""
+    call_command("generate_data", users=users, groups=groups, posts=posts,
+                 comments=comments, follows=follows, seed=rng_seed,
+                 stdout=io.StringIO())
@@ -0,0 +1,256 @@
+"""Прогон всех GET-страниц из posts/urls.py через WSGI-приложение.
+
+Для каждой страницы считаются p50/p95/p99 времени ответа, число
+SQL-запросов на запрос и размер ответа. Результат пишется в JSON;
+с --compare печатается сравнение с предыдущим прогоном.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from urllib.parse import unquote_to_bytes
+
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB = os.path.join(BASE_DIR, "benchmarks", "bench.sqlite3")
+RESULTS_DIR = os.path.join(BASE_DIR, "benchmarks", "results")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default=DEFAULT_DB,
+                        help="файл SQLite с данными для замеров")
+    parser.add_argument("--reuse", action="store_true",
+                        help="не пересоздавать базу, если она уже есть")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--groups", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=100000)
+    parser.add_argument("--comments", type=int, default=100000)
+    parser.add_argument("--follows", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=100,
+                        help="запросов на каждую страницу")
+    parser.add_argument("--cold", action="store_true",
+                        help="очищать кэш перед каждым запросом")
+    parser.add_argument("--output", help="куда сохранить JSON")
+    parser.add_argument("--compare", help="JSON предыдущего прогона")
+    return parser.parse_args(argv)
+
+
+def setup_django(db_path):
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "yatube.settings")
+    from django.conf import settings
+    settings.DATABASES["default"]["NAME"] = db_path
+    settings.CACHES["default"]["LOCATION"] = f"{db_path}.cache"
+    # Без DEBUG: не копим connection.queries и не подключаем debug_toolbar.
+    settings.DEBUG = False
+    import django
+    django.setup()
+
+
+def prepare_database(args):
+    from django.core.management import call_command
+    from benchmarks.dataset import seed
+
+    if os.path.exists(args.db) and args.reuse:
+        call_command("migrate", verbosity=0)
+        return
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    call_command("migrate", verbosity=0)
+    started = time.perf_counter()
+    seed(users=args.users, groups=args.groups, posts=args.posts,
+         comments=args.comments, follows=args.follows, rng_seed=args.seed)
+    print(f"Данные созданы за {time.perf_counter() - started:.1f} с")
+
+
+def session_cookie(user):
+    from django.conf import settings
+    from django.test import Client
+
+    client = Client()
+    client.force_login(user)
+    return f"{settings.SESSION_COOKIE_NAME}=" \
+           f"{client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+
+def targets(rng):
+    """(имя, путь, cookie) для каждой GET-страницы posts/urls.py."""
+    from django.contrib.auth import get_user_model
+    from django.db.models import Count, Max, Min
+    from django.urls import reverse
+    from django.utils.http import urlencode
+    from posts.models import Post, Group
+
+    User = get_user_model()
+    reader = User.objects.annotate(
+        n=Count("follower")
+    ).order_by("-n").first()
+    author = User.objects.annotate(n=Count("posts")).order_by("-n").first()
+    ids = Post.objects.aggregate(low=Min("id"), high=Max("id"))
+    post = Post.objects.select_related("author").filter(
+        pk__gte=rng.randint(ids["low"], ids["high"])
+    ).order_by("pk").first()
+    group = rng.choice(list(Group.objects.all()))
+    reader_cookie = session_cookie(reader)
+    author_cookie = session_cookie(post.author)
+    deep_page = max(Post.objects.count() // 10 - 1, 1)
+    return [
+        ("index", reverse("index"), None),
+        ("index_deep_page", f"{reverse('index')}?page={deep_page}", None),
+        ("group_posts", reverse("group_posts", args=[group.slug]), None),
+        ("profile", reverse("profile", args=[author.username]), None),
+        ("post", reverse("post", args=[post.author.username, post.id]),
+         None),
+        ("post_edit",
+         reverse("post_edit", args=[post.author.username, post.id]),
+         author_cookie),
+        ("new_post", reverse("new_post"), reader_cookie),
+        ("follow_index", reverse("follow_index"), reader_cookie),
+        ("search", f"{reverse('search')}?{urlencode({'q': 'пост'})}", None),
+    ]
+
+
+def request(application, path, cookie):
+    path, _, query = path.partition("?")
+    environ = {
+        "REQUEST_METHOD": "GET",
+        # PEP 3333: байты пути в виде latin-1 строки, как у test Client
+        "PATH_INFO": unquote_to_bytes(path).decode("iso-8859-1"),
+        "QUERY_STRING": query,
+        "SERVER_NAME": "testserver",
+        "SERVER_PORT": "80",
+        "REMOTE_ADDR": "10.0.0.1",
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.version": (1, 0),
+        "wsgi.multithread": False,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    if cookie:
+        environ["HTTP_COOKIE"] = cookie
+    status = []
+    body = application(environ, lambda s, headers: status.append(s))
+    try:
+        size = sum(len(chunk) for chunk in body)
+    finally:
+        if hasattr(body, "close"):
+            body.close()
+    return status[0], size
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def measure(application, path, cookie, count, cold):
+    from django.core.cache import cache
+    from django.db import connection
+
+    queries = []
+
+    def count_queries(execute, sql, params, many, context):
+        queries[-1] += 1
+        return execute(sql, params, many, context)
+
+    timings, sizes, statuses = [], [], set()
+    with connection.execute_wrapper(count_queries):
+        for _ in range(count):
+            if cold:
+                cache.clear()
+            queries.append(0)
+            started = time.perf_counter()
+            status, size = request(application, path, cookie)
+            timings.append((time.perf_counter() - started) * 1000)
+            sizes.append(size)
+            statuses.add(status)
+    return {
+        "path": path,
+        "requests": count,
+        "status": sorted(statuses),
+        "p50_ms": round(percentile(timings, 0.50), 3),
+        "p95_ms": round(percentile(timings, 0.95), 3),
+        "p99_ms": round(percentile(timings, 0.99), 3),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "queries_per_request": round(statistics.mean(queries), 2),
+        "response_bytes": round(statistics.mean(sizes)),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results, previous=None):
+    header = f"{'страница':<18}{'p50':>9}{'p95':>9}{'p99':>9}" \
+             f"{'запросов':>10}{'байт':>10}"
+    print(header)
+    for name, row in results.items():
+        line = f"{name:<18}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}" \
+               f"{row['p99_ms']:>9.2f}{row['queries_per_request']:>10}" \
+               f"{row['response_bytes']:>10}"
+        old = (previous or {}).get(name)
+        if old:
+            change = (row["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100
+            line += f"   p50 {change:+.0f}%"
+        print(line)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_django(args.db)
+    prepare_database(args)
+    from yatube.wsgi import application
+
+    rng = random.Random(args.seed)
+    results = {}
+    for name, path, cookie in targets(rng):
+        # прогрев: шаблоны, соединение, кэш
+        request(application, path, cookie)
+        results[name] = measure(application, path, cookie,
+                                args.requests, args.cold)
+
+    report = {
+        "commit": git_commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "dataset": {key: getattr(args, key) for key in
+                    ("users", "groups", "posts", "comments", "follows",
+                     "seed")},
+        "cold_cache": args.cold,
+        "views": results,
+    }
+    previous = None
+    if args.compare:
+        with open(args.compare) as file:
+            previous = json.load(file)["views"]
+    print_table(results, previous)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{report['created'].replace(':', '-')}-"
+                     f"{report['commit'] or 'nogit'}.json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"Результаты: {output}")
+
+
+if __name__ == "__main__":
+    main()
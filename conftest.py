@@ -0,0 +1,14 @@
+from yatube.testing import IsolatedEnvironment
+
+
+# Тесты курса в tests/ загружают картинки через views; потоки пула не
+# могут писать в базу SQLite в памяти, пока тест держит её таблицы
+environment = IsolatedEnvironment(THUMBNAIL_WORKERS=0)
+
+
+def pytest_sessionstart(session):
+    environment.enable()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    environment.disable()
@@ -0,0 +1,182 @@
+"""Read-only JSON API для мобильных клиентов.
+
+Строки читаются через values() одним запросом с JOIN: без объектов
+моделей, шаблонов и миниатюр. Списки листаются курсором (?after=,
+?before=, ?limit=), ?fields= выбирает поля ответа.
+"""
+from functools import wraps
+
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+
+from .conditional import (conditional, index_scopes, group_scopes,
+                          profile_scopes, post_id_scopes)
+from .models import Post, Group, Comment
+from .paginator import CURSOR_KEY, CursorPaginator, encode_position
+
+
+User = get_user_model()
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Поле ответа -> выражение для values()
+POST_FIELDS = {
+    "id": "id",
+    "text": "text",
+    "pub_date": "pub_date",
+    "author": "author__username",
+    "group": "group__slug",
+    "image": "image",
+    "image_width": "image_width",
+    "image_height": "image_height",
+    "comments_count": "comments_count",
+}
+COMMENT_FIELDS = {
+    "id": "id",
+    "post": "post_id",
+    "author": "author__username",
+    "text": "text",
+    "created": "created",
+}
+COMMENT_KEY = ("created", "id")
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def error(status, message):
+    return JsonResponse({"error": message}, status=status)
+
+
+def api_view(view):
+    """Ошибки ApiError превращаются в JSON-ответ с их статусом."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return error(405, "Только GET")
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as exc:
+            return error(exc.status, str(exc))
+    return wrapper
+
+
+def requested_fields(request, available):
+    raw = request.GET.get("fields")
+    if not raw:
+        return list(available)
+    fields = [field.strip() for field in raw.split(",") if field.strip()]
+    unknown = sorted(set(fields) - set(available))
+    if unknown:
+        raise ApiError(400, f"Неизвестные поля: {', '.join(unknown)}")
+    return fields
+
+
+def requested_limit(request):
+    try:
+        limit = int(request.GET.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError(400, "limit должен быть числом")
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def serialize(row, fields, available):
+    item = {field: row[available[field]] for field in fields}
+    if item.get("image") is not None:
+        storage = Post._meta.get_field("image").storage
+        item["image"] = (storage.url(item["image"])
+                         if item["image"] else None)
+    return item
+
+
+def page_link(request, cursor_name, cursor):
+    params = request.GET.copy()
+    params.pop("after", None)
+    params.pop("before", None)
+    params[cursor_name] = cursor
+    return f"{request.path}?{params.urlencode()}"
+
+
+def cursor_list(request, queryset, available, key=CURSOR_KEY,
+                descending=True):
+    """JSON-страница queryset: results, next и previous."""
+    fields = requested_fields(request, available)
+    date_field, id_field = key
+    columns = {available[field] for field in fields}
+    rows = queryset.values(*columns | {date_field, id_field})
+    paginator = CursorPaginator(rows, requested_limit(request), key,
+                                descending=descending)
+    page = paginator.get_page(after=request.GET.get("after"),
+                              before=request.GET.get("before"))
+    rows = list(page)
+
+    def cursor(row):
+        return encode_position(row[date_field], row[id_field])
+
+    return JsonResponse({
+        "results": [serialize(row, fields, available) for row in rows],
+        "next": (page_link(request, "after", cursor(rows[-1]))
+                 if page.has_next() else None),
+        "previous": (page_link(request, "before", cursor(rows[0]))
+                     if page.has_previous() else None),
+    }, json_dumps_params={"ensure_ascii": False})
+
+
+@api_view
+@conditional(index_scopes)
+def posts(request):
+    return cursor_list(request, Post.objects.all(), POST_FIELDS)
+
+
+@api_view
+@conditional(post_id_scopes)
+def post_detail(request, post_id):
+    fields = requested_fields(request, POST_FIELDS)
+    row = Post.objects.filter(pk=post_id).values(
+        *{POST_FIELDS[field] for field in fields}
+    ).first()
+    if row is None:
+        raise ApiError(404, "Пост не найден")
+    return JsonResponse(serialize(row, fields, POST_FIELDS),
+                        json_dumps_params={"ensure_ascii": False})
+
+
+@api_view
+@conditional(group_scopes)
+def group_posts(request, slug):
+    group = Group.objects.filter(slug=slug).first()
+    if group is None:
+        raise ApiError(404, "Группа не найдена")
+    return cursor_list(request, group.posts.all(), POST_FIELDS)
+
+
+@api_view
+@conditional(profile_scopes)
+def author_posts(request, username):
+    author = User.objects.filter(username=username).first()
+    if author is None:
+        raise ApiError(404, "Автор не найден")
+    return cursor_list(request, author.posts.all(), POST_FIELDS)
+
+
+@api_view
+def follow_posts(request):
+    if not request.user.is_authenticated:
+        raise ApiError(401, "Нужна авторизация")
+    # Дата и id берутся из материализованной ленты, как в follow_index
+    fields = dict(POST_FIELDS, id="feed_post", pub_date="feed_date")
+    return cursor_list(request, Post.objects.timeline(request.user), fields,
+                       key=("feed_date", "feed_post"))
+
+
+@api_view
+@conditional(post_id_scopes)
+def post_comments(request, post_id):
+    if not Post.objects.filter(pk=post_id).exists():
+        raise ApiError(404, "Пост не найден")
+    return cursor_list(request, Comment.objects.filter(post_id=post_id),
+                       COMMENT_FIELDS, key=COMMENT_KEY, descending=False)
@@ -0,0 +1,22 @@
+from django.urls import path
+from . import api
+
+
+app_name = 'api'
+
+urlpatterns = [
+    path('posts/', api.posts, name='posts'),
+    path('posts/<int:post_id>/', api.post_detail, name='post'),
+    path(
+            'posts/<int:post_id>/comments/',
+            api.post_comments,
+            name='comments'
+        ),
+    path('groups/<slug>/posts/', api.group_posts, name='group_posts'),
+    path(
+            'authors/<str:username>/posts/',
+            api.author_posts,
+            name='author_posts'
+        ),
+    path('follow/posts/', api.follow_posts, name='follow_posts'),
+]
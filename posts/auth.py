@@ -0,0 +1,63 @@
+"""Пользователь запроса без обращений к базе.
+
+CachedAuthenticationMiddleware заменяет AuthenticationMiddleware:
+объект пользователя берётся из кэша по id из сессии, а проверки те же,
+что у django.contrib.auth.get_user (бэкенд из настроек, хэш пароля в
+сессии). Запись сбрасывается при сохранении и удалении пользователя
+(posts.signals); права в ней не хранятся, они читаются из базы только
+при проверке. Анониму без cookie сессии не нужен ни кэш, ни база.
+"""
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+
+def user_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def forget_user(user_id):
+    cache.delete(user_key(user_id))
+
+
+def get_user(request):
+    session = request.session
+    try:
+        user_id = auth._get_user_session_key(request)
+    except (KeyError, ValueError):
+        return AnonymousUser()
+    backend_path = session.get(auth.BACKEND_SESSION_KEY)
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+    user = cache.get(user_key(user_id))
+    if user is None:
+        # Полная проверка Django; в кэш — только успешный результат
+        user = auth.get_user(request)
+        if user.is_authenticated:
+            cache.set(user_key(user_id), user,
+                      settings.AUTH_USER_CACHE_TIMEOUT)
+        return user
+    session_hash = session.get(auth.HASH_SESSION_KEY)
+    if not (session_hash and constant_time_compare(
+        session_hash, user.get_session_auth_hash()
+    )):
+        session.flush()
+        return AnonymousUser()
+    user.backend = backend_path
+    return user
+
+
+def cached_user(request):
+    if not hasattr(request, "_cached_user"):
+        request._cached_user = get_user(request)
+    return request._cached_user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: cached_user(request))
@@ -0,0 +1,106 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+from . import replicas
+
+
+FEED_VERSION_KEY = "feed:version"
+COUNT_VERSION_KEY = "feed:count-version"
+
+
+def feed_version(key=FEED_VERSION_KEY):
+    """Текущая версия лент. Начальное значение берётся из часов, чтобы
+    после вытеснения ключа версия не совпала со старыми записями."""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_feed_version(key=FEED_VERSION_KEY):
+    """Делает недействительными все закэшированные страницы лент."""
+    try:
+        cache.incr(key)
+    except ValueError:
+        feed_version(key)
+
+
+def count_version():
+    """Версия числа постов в лентах. Комментарии и правки его не меняют,
+    поэтому она отдельна от feed_version."""
+    return feed_version(COUNT_VERSION_KEY)
+
+
+def bump_count_version():
+    """Вызывается, когда в какой-либо ленте меняется число постов:
+    пост создан, удалён или перенесён в другую группу, подписка
+    создана или удалена, ленты подписок пересобраны или обрезаны."""
+    bump_feed_version(COUNT_VERSION_KEY)
+
+
+def touch(*scopes):
+    """Запоминает время изменения данных страниц scopes: "posts",
+    "group:<id>", "author:<id>", "post:<id>". По нему строятся ETag
+    и Last-Modified (posts.conditional)."""
+    now = time.time()
+    cache.set_many({f"changed:{scope}": now for scope in scopes}, None)
+
+
+def last_changed(*scopes):
+    """Время последнего изменения по scopes. Если отметки нет (кэш
+    очищен), ею становится текущее время — страница будет отдана
+    заново один раз."""
+    keys = [f"changed:{scope}" for scope in scopes]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        now = time.time()
+        for key in missing:
+            cache.add(key, now, None)
+        found.update(cache.get_many(missing))
+    return max(found.values())
+
+
+def feed_key(fragment_name, vary_on):
+    return make_template_fragment_key(
+        f"feed:{fragment_name}", [feed_version(), *vary_on]
+    )
+
+
+def get_or_render(key, render, timeout=None):
+    """Значение из кэша с защитой от одновременной перегенерации.
+
+    Запись хранится дольше своего срока свежести: пока один запрос
+    (взявший блокировку) перерисовывает устаревшую запись, остальные
+    получают старую. Если записи нет совсем, они недолго ждут результат
+    и только потом рисуют сами, ничего не сохраняя. Сохраняемое
+    значение читается из default, а не с реплики.
+    """
+    if timeout is None:
+        timeout = settings.FEED_CACHE_TIMEOUT
+    entry = cache.get(key)
+    if entry is not None and entry[0] > time.time():
+        return entry[1]
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, 1, settings.FEED_CACHE_LOCK_TIMEOUT):
+        try:
+            with replicas.primary():
+                value = render()
+            cache.set(key, (time.time() + timeout, value),
+                      timeout + settings.FEED_CACHE_STALE_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+        return value
+    if entry is not None:
+        return entry[1]
+    deadline = time.time() + settings.FEED_CACHE_LOCK_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[1]
+    return render()
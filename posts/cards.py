@@ -0,0 +1,85 @@
+"""Кэш карточек постов (include/post_card.html).
+
+Карточка одинакова для всех посетителей и хранится под ключом
+card:<id>:<card_version>; версия лежит в строке поста и растёт при
+правке, комментарии, переименовании группы и готовности миниатюры
+(posts.signals), поэтому все карточки страницы достаются одним
+get_many. Ссылка «Редактировать» зависит от посетителя и вставляется
+в место EDIT_SLOT уже после кэша (include/post_item.html). Внутри
+фрагмента {% feedcache %}, общего для всех, на её месте остаётся метка
+EDIT_MARK, которую fill_edit_links заменяет уже после кэша.
+"""
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.safestring import mark_safe
+
+from .thumbnails import cached_thumbnail
+
+
+CARD_TEMPLATE = "include/post_card.html"
+EDIT_SLOT = "<!-- edit-link -->"
+EDIT_TEMPLATE = "include/edit_link.html"
+EDIT_MARK = "<!-- edit-link:{author_id}:{url} -->"
+EDIT_MARK_RE = re.compile(r"<!-- edit-link:(\d+):(\S+) -->")
+
+
+def card_key(post):
+    return f"card:{post.pk}:{post.card_version}"
+
+
+def render_card(post):
+    """(начало, конец) карточки и признак, можно ли её кэшировать:
+    карточку с заглушкой вместо миниатюры не кэшируем."""
+    thumbnail = cached_thumbnail(post.image) if post.image else None
+    html = render_to_string(CARD_TEMPLATE, {"post": post,
+                                            "thumbnail": thumbnail})
+    head, _, tail = html.partition(EDIT_SLOT)
+    return (head, tail), not post.image or thumbnail is not None
+
+
+def get_cards(posts):
+    """Карточки posts по id поста: одно чтение кэша на все, отсутствующие
+    рисуются и записываются одним set_many."""
+    keys = {card_key(post): post for post in posts}
+    found = cache.get_many(list(keys))
+    rendered = {}
+    for key, post in keys.items():
+        if key not in found:
+            found[key], cacheable = render_card(post)
+            if cacheable:
+                rendered[key] = found[key]
+    if rendered:
+        cache.set_many(rendered, settings.CARD_CACHE_TIMEOUT)
+    return {post.pk: tuple(mark_safe(part) for part in found[key])
+            for key, post in keys.items()}
+
+
+def edit_url(post):
+    return reverse("post_edit", args=[post.author.username, post.pk])
+
+
+def edit_link(post, user, deferred=False):
+    """Ссылка на правку для автора поста; deferred — метка для
+    fill_edit_links вместо ссылки."""
+    if deferred:
+        return mark_safe(EDIT_MARK.format(author_id=post.author_id,
+                                          url=edit_url(post)))
+    if user is None or user.pk != post.author_id:
+        return ""
+    return render_to_string(EDIT_TEMPLATE, {"url": edit_url(post)})
+
+
+def fill_edit_links(html, user):
+    """Заменяет метки EDIT_MARK ссылками для постов user."""
+    user_id = getattr(user, "pk", None)
+
+    def replace(match):
+        if user_id is None or int(match.group(1)) != user_id:
+            return ""
+        return render_to_string(EDIT_TEMPLATE, {"url": match.group(2)})
+
+    return EDIT_MARK_RE.sub(replace, html)
@@ -0,0 +1,94 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.views.decorators.http import condition
+
+from . import replicas
+from .cache import last_changed
+from .models import Group
+
+
+User = get_user_model()
+
+
+def _user_scope(username):
+    pk = User.objects.filter(username=username).values_list(
+        "pk", flat=True
+    ).first()
+    return None if pk is None else f"author:{pk}"
+
+
+def index_scopes(request):
+    return ("posts",)
+
+
+def group_scopes(request, slug):
+    pk = Group.objects.filter(slug=slug).values_list("pk", flat=True).first()
+    return None if pk is None else (f"group:{pk}",)
+
+
+def profile_scopes(request, username):
+    scope = _user_scope(username)
+    return None if scope is None else (scope,)
+
+
+def post_scopes(request, username, post_id):
+    scope = _user_scope(username)
+    return None if scope is None else (f"post:{post_id}", scope)
+
+
+def post_id_scopes(request, post_id):
+    return (f"post:{post_id}",)
+
+
+def conditional(scopes):
+    """condition() для страницы, данные которой описаны scopes.
+
+    ETag учитывает время изменения данных, адрес с параметрами,
+    пользователя и CSRF-cookie (токен в формах страницы); страница при
+    этом не рендерится. Last-Modified отдаётся только анонимам: по нему
+    одному нельзя отличить смену пользователя. Ответ, прочитанный с
+    реплики, уходит без них: данные могут быть старше отметки.
+    """
+    def changed(request, *args, **kwargs):
+        if not hasattr(request, "_last_changed"):
+            with replicas.primary():
+                names = scopes(request, *args, **kwargs)
+            request._last_changed = (
+                None if names is None else last_changed(*names)
+            )
+        return request._last_changed
+
+    def etag(request, *args, **kwargs):
+        timestamp = changed(request, *args, **kwargs)
+        if timestamp is None:
+            return None
+        user = request.user.pk if request.user.is_authenticated else ""
+        csrf = request.COOKIES.get(settings.CSRF_COOKIE_NAME, "")
+        raw = f"{request.get_full_path()}|{user}|{csrf}|{timestamp!r}"
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return None
+        timestamp = changed(request, *args, **kwargs)
+        if timestamp is None:
+            return None
+        return datetime.fromtimestamp(timestamp, timezone.utc)
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag,
+                                     last_modified_func=last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if replicas.used():
+                del response["ETag"]
+                del response["Last-Modified"]
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,142 @@
+"""Бэкенд SQLite для нагруженного сервера.
+
+Отличия от django.db.backends.sqlite3:
+
+* каждое соединение включает WAL и настраивает pragma (PRAGMAS);
+  читатели в WAL не ждут писателя;
+* transaction.atomic() начинает транзакцию с BEGIN IMMEDIATE: блокировка
+  записи берётся сразу, и ожидание идёт через busy timeout, а не
+  заканчивается «database is locked» при попытке повысить блокировку;
+* транзакции одного процесса выстраиваются в очередь на запись длиной
+  не больше WRITE_QUEUE_SIZE; если очередь полна или место не
+  освободилось за WRITE_TIMEOUT секунд, поднимается WriteQueueFull.
+
+Соединения между запросами сохраняет стандартный CONN_MAX_AGE.
+
+    DATABASES = {"default": {
+        "ENGINE": "posts.db",
+        "NAME": "db.sqlite3",
+        "CONN_MAX_AGE": 600,
+        "OPTIONS": {"timeout": 20, "WRITE_QUEUE_SIZE": 64},
+    }}
+"""
+import os
+import threading
+
+from django.db.backends.sqlite3 import base
+from django.db.utils import OperationalError
+
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    # В WAL fsync только при checkpoint: коммит не ждёт диска, но
+    # база не портится при падении процесса
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+}
+
+
+class WriteQueueFull(OperationalError):
+    pass
+
+
+class WriteQueue:
+    """Очередь транзакций на запись в один файл базы внутри процесса."""
+
+    def __init__(self, size):
+        self.size = size
+        self.condition = threading.Condition()
+        self.busy = False
+        self.waiting = 0
+
+    def acquire(self, timeout):
+        with self.condition:
+            if self.busy and self.waiting >= self.size:
+                raise WriteQueueFull("Очередь записи в базу переполнена")
+            self.waiting += 1
+            try:
+                if not self.condition.wait_for(lambda: not self.busy,
+                                               timeout):
+                    raise WriteQueueFull("Не дождались очереди записи")
+            finally:
+                self.waiting -= 1
+            self.busy = True
+
+    def release(self):
+        with self.condition:
+            self.busy = False
+            self.condition.notify()
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def write_queue(name, size):
+    # Очередь своя у каждого процесса: после fork заводится новая
+    key = (os.getpid(), name)
+    with _queues_lock:
+        if key not in _queues:
+            _queues[key] = WriteQueue(size)
+        return _queues[key]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._write_queue = None
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        options = {key: params.pop(key) for key in
+                   ("PRAGMAS", "WRITE_QUEUE_SIZE", "WRITE_TIMEOUT")
+                   if key in params}
+        self.pragmas = {**PRAGMAS, **options.get("PRAGMAS", {})}
+        self.write_queue_size = options.get("WRITE_QUEUE_SIZE", 64)
+        self.write_timeout = options.get("WRITE_TIMEOUT",
+                                         params.get("timeout", 5))
+        return params
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            if name == "journal_mode" and self.is_in_memory_db():
+                continue
+            connection.execute(f"PRAGMA {name} = {value}")
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        queue = write_queue(self.settings_dict["NAME"],
+                            self.write_queue_size)
+        queue.acquire(self.write_timeout)
+        self._write_queue = queue
+        try:
+            self.cursor().execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self._release_write_queue()
+            raise
+
+    def _release_write_queue(self):
+        if self._write_queue is not None:
+            self._write_queue.release()
+            self._write_queue = None
+
+    def _commit(self):
+        try:
+            super()._commit()
+        finally:
+            self._release_write_queue()
+
+    def _rollback(self):
+        try:
+            super()._rollback()
+        finally:
+            self._release_write_queue()
+
+    def _close(self):
+        try:
+            super()._close()
+        finally:
+            self._release_write_queue()
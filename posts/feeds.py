@@ -0,0 +1,139 @@
+"""RSS и Atom для общей ленты, сообществ и авторов.
+
+Готовый XML хранится в кэше под ключом с временем изменения данных
+(posts.conditional), так что новая запись сама делает старый снимок
+ненужным. Опрос без изменений получает 304 без обращения к снимку.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.syndication.views import Feed
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.text import Truncator
+
+from .cache import get_or_render
+from .conditional import (conditional, index_scopes, group_scopes,
+                          profile_scopes)
+from .models import Post, Group
+
+
+User = get_user_model()
+
+
+class PostFeed(Feed):
+    def items(self, obj):
+        return self.posts(obj).for_feed().order_by(
+            "-pub_date", "-id"
+        )[:settings.SYNDICATION_ITEMS]
+
+    def item_title(self, item):
+        return Truncator(item.text).words(8)
+
+    def item_description(self, item):
+        return item.text
+
+    def item_link(self, item):
+        return reverse("post", args=[item.author.username, item.pk])
+
+    def item_pubdate(self, item):
+        return item.pub_date
+
+    def item_author_name(self, item):
+        return item.author.get_full_name() or item.author.username
+
+    def item_categories(self, item):
+        return [item.group.title] if item.group else []
+
+
+class IndexFeed(PostFeed):
+    title = "Yatube: последние записи"
+    description = "Новые записи всех авторов"
+
+    def link(self):
+        return reverse("index")
+
+    def posts(self, obj):
+        return Post.objects.all()
+
+
+class GroupFeed(PostFeed):
+    def get_object(self, request, slug):
+        return get_object_or_404(Group, slug=slug)
+
+    def title(self, group):
+        return f"Yatube: {group.title}"
+
+    def description(self, group):
+        return group.description
+
+    def link(self, group):
+        return reverse("group_posts", args=[group.slug])
+
+    def posts(self, group):
+        return group.posts.all()
+
+
+class AuthorFeed(PostFeed):
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def title(self, author):
+        return f"Yatube: {author.get_full_name() or author.username}"
+
+    def description(self, author):
+        return f"Записи {author.username}"
+
+    def link(self, author):
+        return reverse("profile", args=[author.username])
+
+    def posts(self, author):
+        return author.posts.all()
+
+
+class AtomIndexFeed(IndexFeed):
+    feed_type = Atom1Feed
+    subtitle = IndexFeed.description
+
+
+class AtomGroupFeed(GroupFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, group):
+        return self.description(group)
+
+
+class AtomAuthorFeed(AuthorFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, author):
+        return self.description(author)
+
+
+def cached_feed(feed, scopes):
+    """Представление ленты feed со снимком в кэше и conditional GET."""
+    @conditional(scopes)
+    def view(request, *args, **kwargs):
+        changed = request._last_changed
+        if changed is None:
+            # Объекта нет: Feed ответит 404
+            return feed(request, *args, **kwargs)
+
+        def render():
+            response = feed(request, *args, **kwargs)
+            return response["Content-Type"], response.content
+
+        content_type, content = get_or_render(
+            f"syndication:{request.get_full_path()}:{changed}", render
+        )
+        return HttpResponse(content, content_type=content_type)
+    return view
+
+
+index_rss = cached_feed(IndexFeed(), index_scopes)
+index_atom = cached_feed(AtomIndexFeed(), index_scopes)
+group_rss = cached_feed(GroupFeed(), group_scopes)
+group_atom = cached_feed(AtomGroupFeed(), group_scopes)
+author_rss = cached_feed(AuthorFeed(), profile_scopes)
+author_atom = cached_feed(AtomAuthorFeed(), profile_scopes)
@@ -1,5 +1,6 @@
 from .models import Post, Comment
-from django.forms import ModelForm
+from django.conf import settings
+from django.forms import ModelForm, ValidationError
 
 
 class PostForm(ModelForm):
@@ -7,6 +8,19 @@ class PostForm(ModelForm):
         model = Post
         fields = ('group', 'text', 'image')
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        # forms.ImageField уже прочитал заголовок и оставил его в .image
+        opened = getattr(image, 'image', None)
+        if opened is not None:
+            width, height = opened.size
+            if width * height > settings.IMAGE_MAX_PIXELS:
+                raise ValidationError(
+                    'Слишком большое изображение: %(width)s×%(height)s',
+                    params={'width': width, 'height': height},
+                )
+        return image
+
 
 class CommentForm(ModelForm):
     class Meta:
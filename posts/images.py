@@ -0,0 +1,98 @@
+"""Обработка загруженных картинок постов.
+
+Оригинал уменьшается до IMAGE_MAX_SIZE по длинной стороне,
+поворачивается по EXIF и пересжимается без метаданных (кроме
+цветового профиля). Результат сохраняется в хранилище картинок как
+новый файл, пост переключается на него вместе с размерами, а ссылка
+на оригинал отпускается.
+"""
+import io
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .models import Post
+from .signals import post_changed
+
+
+logger = logging.getLogger(__name__)
+
+LANCZOS = getattr(Image, "Resampling", Image).LANCZOS
+# Форматы, которые пересжимаются; у остальных (GIF с анимацией и т.п.)
+# только запоминаются размеры.
+RECOMPRESS = {"JPEG", "PNG", "WEBP"}
+
+
+def recompress(image, image_format):
+    limit = settings.IMAGE_MAX_SIZE
+    image = ImageOps.exif_transpose(image)
+    if max(image.size) > limit:
+        image.thumbnail((limit, limit), LANCZOS)
+    options = {"icc_profile": image.info.get("icc_profile")}
+    if image_format == "JPEG":
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        options.update(quality=settings.IMAGE_QUALITY, optimize=True,
+                       progressive=True)
+    elif image_format == "WEBP":
+        options.update(quality=settings.IMAGE_QUALITY)
+    else:
+        options.update(optimize=True)
+    output = io.BytesIO()
+    image.save(output, image_format,
+               **{key: value for key, value in options.items() if value})
+    return image.size, output.getvalue()
+
+
+def image_storage():
+    return Post._meta.get_field("image").storage
+
+
+def ingest(name, storage=None):
+    """Обрабатывает файл name; возвращает ((ширина, высота), имя файла
+    результата) или None, если картинку не удалось прочитать. Для
+    форматов без пересжатия имя остаётся прежним."""
+    storage = storage or image_storage()
+    try:
+        with storage.open(name) as source:
+            image = Image.open(source)
+            image_format = image.format
+            if image_format not in RECOMPRESS:
+                return image.size, name
+            if image_format == "JPEG":
+                # Декодер JPEG сразу уменьшает картинку в 2-8 раз
+                limit = settings.IMAGE_MAX_SIZE
+                image.draft("RGB", (limit, limit))
+            image.load()
+        size, content = recompress(image, image_format)
+    except Exception:
+        logger.exception("Не удалось обработать картинку %s", name)
+        return None
+    saved = storage.save(name, ContentFile(content))
+    if saved == name:
+        # Результат совпал с исходным файлом: лишняя ссылка не нужна
+        storage.delete(saved)
+    return size, saved
+
+
+def ingest_post(post_id, name):
+    """ingest() для картинки поста. Возвращает имя новой картинки или
+    None; если пост за это время сменил картинку, результат выбрасывается.
+    """
+    result = ingest(name)
+    if result is None:
+        return None
+    (width, height), processed = result
+    updated = Post.objects.filter(pk=post_id, image=name).update(
+        image=processed, image_width=width, image_height=height
+    )
+    if processed == name:
+        return name if updated else None
+    image_storage().delete(name if updated else processed)
+    if not updated:
+        return None
+    # Закэшированные страницы ссылаются на отпущенный файл
+    post_changed(post_id)
+    return processed
@@ -0,0 +1,45 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from posts import timing
+
+
+class Command(BaseCommand):
+    help = ("Выводит гистограммы Server-Timing по view, собранные "
+            "всеми процессами сервера")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--json", action="store_true",
+                            help="Вывести сырые гистограммы в JSON")
+        parser.add_argument("--view", help="Только этот view")
+
+    def handle(self, *args, **options):
+        data = timing.load_histograms()
+        if options["view"]:
+            data = {options["view"]: data.get(options["view"], {})}
+        if options["json"]:
+            self.stdout.write(json.dumps(
+                {"buckets": timing.BUCKETS[:-1], "views": data}, indent=2
+            ))
+            return
+        if not data:
+            self.stdout.write("Замеров пока нет")
+            return
+        self.stdout.write(
+            f"{'view':<22}{'фаза':<7}{'запросов':>9}{'среднее':>9}"
+            f"{'p50':>7}{'p95':>7}{'p99':>7}  (мс, p — верхняя граница "
+            f"корзины)"
+        )
+        for view in sorted(data):
+            for phase in (*timing.PHASES, "app", "total"):
+                row = data[view].get(phase)
+                if not row:
+                    continue
+                self.stdout.write(
+                    f"{view:<22}{phase:<7}{row['count']:>9}"
+                    f"{row['sum'] / row['count']:>9.1f}"
+                    f"{timing.percentile(row, 0.50):>7g}"
+                    f"{timing.percentile(row, 0.95):>7g}"
+                    f"{timing.percentile(row, 0.99):>7g}"
+                )
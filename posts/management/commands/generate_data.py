@@ -0,0 +1,260 @@
+import io
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from posts import search, timeline
+from posts.cache import bump_count_version, bump_feed_version
+from posts.models import Post, Group, Comment, Follow
+
+
+User = get_user_model()
+
+PASSWORD = "synthetic"
+WORDS = (
+    "пост день город утро вечер кофе книга фильм музыка работа дом море "
+    "лес горы дорога поезд кот собака погода дождь снег солнце друзья "
+    "проект код python django база запрос кэш лента подписка фото новость "
+    "идея план отпуск спорт бег рецепт ужин завтрак выставка концерт"
+).split()
+IMAGE_COLORS = ("#d35400", "#2980b9", "#27ae60", "#8e44ad",
+                "#c0392b", "#16a085", "#f39c12", "#2c3e50")
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """Отключает auto_now_add, чтобы bulk_create сохранил заданные даты."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = ("Заполняет базу синтетическими пользователями, группами, "
+            "постами, комментариями и подписками")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--groups", type=int, default=20)
+        parser.add_argument("--posts", type=int, default=10000)
+        parser.add_argument("--comments", type=int, default=20000)
+        parser.add_argument("--follows", type=int, default=10000)
+        parser.add_argument("--images", type=float, default=0,
+                            help="Доля постов с картинкой, от 0 до 1")
+        parser.add_argument("--days", type=int, default=365,
+                            help="За сколько дней распределить посты")
+        parser.add_argument("--alpha", type=float, default=1.2,
+                            help="Показатель степенного распределения "
+                                 "популярности авторов")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--prefix", default="user",
+                            help="Префикс имён пользователей")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--no-rebuild", action="store_true",
+            help="Не пересобирать ленты подписок. Лент до TIMELINE_LENGTH "
+                 "строк на каждого подписанного читателя: на миллионах "
+                 "строк пересборка дольше самой генерации и в разы "
+                 "увеличивает базу; её можно запустить потом командой "
+                 "rebuild_timelines"
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.started = time.perf_counter()
+        self.now = timezone.now()
+        self.period = timedelta(days=options["days"])
+
+        user_ids = self.create_users(options["users"], options["prefix"])
+        group_ids = self.create_groups(options["groups"], options["prefix"])
+        # Популярность авторов по закону Ципфа: немногие пишут много
+        # и собирают большинство подписчиков.
+        weights = list(accumulate(
+            1 / rank ** options["alpha"] for rank in range(1, len(user_ids) + 1)
+        ))
+        popular = user_ids[:]
+        self.rng.shuffle(popular)
+        images = self.create_images(options["images"])
+        posts = self.create_posts(options["posts"], popular, weights,
+                                  group_ids, images, options["images"])
+        self.count_image_references(images)
+        self.create_comments(options["comments"], posts, user_ids)
+        self.create_follows(options["follows"], popular, weights, user_ids)
+
+        generated = time.perf_counter() - self.started
+        durations = [("данные", generated)]
+        if options["no_rebuild"]:
+            self.log("Ленты не пересобраны: manage.py rebuild_timelines")
+        else:
+            self.log("Пересборка лент")
+            durations.append(("ленты", self.timed(
+                timeline.rebuild, batch_size=self.batch_size
+            )))
+        self.log("Пересборка счётчиков и поиска")
+        durations.append(("счётчики", self.timed(
+            call_command, "reconcile_stats", stdout=io.StringIO()
+        )))
+        durations.append(("поиск", self.timed(search.rebuild)))
+        bump_feed_version()
+        bump_count_version()
+        details = ", ".join(f"{name} {seconds:.1f} с"
+                            for name, seconds in durations)
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово за {time.perf_counter() - self.started:.1f} с "
+            f"({details})"
+        ))
+
+    def timed(self, function, *args, **kwargs):
+        started = time.perf_counter()
+        function(*args, **kwargs)
+        return time.perf_counter() - started
+
+    def log(self, message):
+        if self.verbosity > 0:
+            elapsed = time.perf_counter() - self.started
+            self.stdout.write(f"[{elapsed:7.1f} с] {message}")
+
+    def insert(self, model, rows):
+        """bulk_create порциями по batch_size, каждая в своей транзакции.
+
+        Размер самого INSERT Django выбирает сам: у SQLite ограничено
+        число параметров и термов в составном SELECT.
+        """
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                with transaction.atomic():
+                    model.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+
+    def create_users(self, count, prefix):
+        self.log(f"Пользователи: {count}")
+        start = User.objects.count()
+        password = make_password(PASSWORD)
+        self.insert(User, (
+            User(username=f"{prefix}{i}", password=password)
+            for i in range(start, start + count)
+        ))
+        return list(User.objects.filter(
+            username__startswith=prefix
+        ).order_by("pk").values_list("pk", flat=True))
+
+    def create_groups(self, count, prefix):
+        self.log(f"Группы: {count}")
+        start = Group.objects.count()
+        self.insert(Group, (
+            Group(title=f"Группа {i}", slug=f"{prefix}-group-{i}",
+                  description=self.text(10, 30))
+            for i in range(start, start + count)
+        ))
+        return list(Group.objects.values_list("pk", flat=True))
+
+    def create_images(self, share):
+        if share <= 0:
+            return []
+        names = []
+        storage = Post._meta.get_field("image").storage
+        for i, color in enumerate(IMAGE_COLORS):
+            buffer = io.BytesIO()
+            Image.new("RGB", (1200, 800), color).save(buffer, "JPEG")
+            names.append(storage.save(
+                f"posts/synthetic-{i}.jpg", ContentFile(buffer.getvalue())
+            ))
+        return names
+
+    def count_image_references(self, images):
+        # bulk_create обходит сигналы: ссылки постов учитываются здесь,
+        # а ссылка, взятая при сохранении файла, отпускается.
+        storage = Post._meta.get_field("image").storage
+        for name in images:
+            count = Post.objects.filter(image=name).count()
+            if count:
+                storage.retain(name, count)
+            storage.delete(name)
+
+    def create_posts(self, count, authors, weights, group_ids, images,
+                     share):
+        self.log(f"Посты: {count}")
+        rng = self.rng
+        group_ids = [None] + group_ids
+        period = self.period.total_seconds()
+        # Идём от старых постов к новым, чтобы id росли вместе с датой.
+        offsets = sorted((rng.random() * period for _ in range(count)),
+                         reverse=True)
+        first = Post.objects.order_by("-pk").values_list(
+            "pk", flat=True
+        ).first() or 0
+        with explicit_dates(Post._meta.get_field("pub_date")):
+            self.insert(Post, (
+                Post(text=self.text(5, 80),
+                     author_id=rng.choices(authors, cum_weights=weights)[0],
+                     group_id=rng.choice(group_ids),
+                     image=(rng.choice(images)
+                            if images and rng.random() < share else None),
+                     pub_date=self.now - timedelta(seconds=offset))
+                for offset in offsets
+            ))
+        return list(Post.objects.filter(pk__gt=first).order_by(
+            "pk"
+        ).values_list("pk", "pub_date"))
+
+    def create_comments(self, count, posts, user_ids):
+        self.log(f"Комментарии: {count}")
+        if not posts:
+            return
+        rng = self.rng
+        # Свежие посты комментируют чаще: смещаем выбор к концу списка.
+        last = len(posts) - 1
+
+        def comment():
+            post_id, pub_date = posts[last - int(rng.betavariate(1, 3) * last)]
+            age = (self.now - pub_date).total_seconds()
+            return Comment(text=self.text(2, 30), post_id=post_id,
+                           author_id=rng.choice(user_ids),
+                           created=pub_date + timedelta(
+                               seconds=rng.random() * age
+                           ))
+
+        with explicit_dates(Comment._meta.get_field("created")):
+            self.insert(Comment, (comment() for _ in range(count)))
+
+    def create_follows(self, count, authors, weights, user_ids):
+        rng = self.rng
+        existing = set(Follow.objects.values_list("user_id", "author_id"))
+        possible = len(user_ids) * (len(user_ids) - 1) - len(existing)
+        count = max(min(count, possible), 0)
+        self.log(f"Подписки: {count}")
+        # Подписчики равномерны, авторы — по степенному закону, поэтому у
+        # популярных авторов хвост из тысяч подписчиков.
+        pairs = set()
+        while len(pairs) < count:
+            pair = (rng.choice(user_ids),
+                    rng.choices(authors, cum_weights=weights)[0])
+            if pair[0] != pair[1] and pair not in existing:
+                pairs.add(pair)
+        self.insert(Follow, (Follow(user_id=user_id, author_id=author_id)
+                             for user_id, author_id in sorted(pairs)))
+
+    def text(self, low, high):
+        return " ".join(self.rng.choices(WORDS, k=self.rng.randint(low, high)))
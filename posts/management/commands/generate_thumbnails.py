@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.cache import bump_feed_version, touch
+from posts.models import Post
+from posts.signals import bump_card, post_scopes
+
+
+class Command(BaseCommand):
+    help = "Создаёт недостающие миниатюры картинок постов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4,
+                            help="Число потоков; 1 — без пула")
+
+    def handle(self, *args, **options):
+        # Одну картинку могут разделять несколько постов (posts.storage):
+        # каждая миниатюра генерируется один раз
+        names = Post.objects.exclude(image="").exclude(
+            image__isnull=True
+        ).order_by().values_list("image", flat=True).distinct().iterator()
+        missing = [name for name in names
+                   if thumbnails.cached_thumbnail(name) is None]
+        if options["workers"] > 1:
+            with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+                results = list(pool.map(thumbnails.generate_in_thread,
+                                        missing))
+        else:
+            results = [thumbnails.generate(name) for name in missing]
+        created = [name for name, ok in zip(missing, results) if ok]
+        if created:
+            self.invalidate(created)
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано миниатюр: {len(created)}, "
+            f"ошибок: {results.count(False)}"
+        ))
+
+    def invalidate(self, names):
+        """Страницы, закэшированные с заглушкой, должны получить
+        миниатюру, как после thumbnails.process."""
+        bump_card(image__in=names)
+        bump_feed_version()
+        scopes = set()
+        for post in Post.objects.filter(image__in=names).only(
+            "pk", "author_id", "group_id"
+        ):
+            scopes.update(post_scopes(post))
+        touch(*scopes)
@@ -0,0 +1,57 @@
+import os
+import shutil
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import profiling
+
+
+class Command(BaseCommand):
+    help = ("Сводит стеки сэмплирующего профайлера в файл на view "
+            "для flamegraph.pl или speedscope")
+
+    def add_arguments(self, parser):
+        parser.add_argument("views", nargs="*",
+                            help="Только эти view (по умолчанию все)")
+        parser.add_argument("--output",
+                            help="Куда писать <view>.folded; по умолчанию "
+                                 "PROFILING_DIR/merged")
+        parser.add_argument("--clear", action="store_true",
+                            help="Удалить исходные стеки после сведения")
+
+    def handle(self, *args, **options):
+        root = settings.PROFILING_DIR
+        output = options["output"] or os.path.join(root, "merged")
+        views = options["views"]
+        if not views and os.path.isdir(root):
+            views = [
+                name for name in sorted(os.listdir(root))
+                if os.path.isdir(os.path.join(root, name))
+                and os.path.abspath(os.path.join(root, name))
+                != os.path.abspath(output)
+            ]
+        os.makedirs(output, exist_ok=True)
+        for view in views:
+            directory = profiling.view_directory(view)
+            if not os.path.isdir(directory):
+                self.stderr.write(f"Нет стеков для {view}")
+                continue
+            files = [os.path.join(directory, name)
+                     for name in os.listdir(directory)
+                     if name.endswith(".folded")]
+            stacks = Counter()
+            for path in files:
+                stacks.update(profiling.read_stacks(path))
+            target = os.path.join(output,
+                                  f"{os.path.basename(directory)}.folded")
+            with open(target, "w") as file:
+                for stack, count in sorted(stacks.items()):
+                    file.write(f"{stack} {count}\n")
+            if options["clear"]:
+                shutil.rmtree(directory)
+            self.stdout.write(
+                f"{view}: запросов {len(files)}, "
+                f"сэмплов {sum(stacks.values())} -> {target}"
+            )
@@ -0,0 +1,75 @@
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import delete
+
+from posts import thumbnails
+from posts.cache import bump_feed_version, touch
+from posts.models import Post
+from posts.signals import post_scopes
+from posts.storage import is_addressed
+
+
+class Command(BaseCommand):
+    help = ("Переносит картинки постов со старыми именами в хранилище по "
+            "хэшу содержимого (posts.storage)")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--delete-old", action="store_true",
+                            help="Удалить перенесённые файлы со старыми "
+                                 "именами и их миниатюры")
+        parser.add_argument("--no-thumbnails", action="store_true",
+                            help="Не создавать миниатюры до переключения")
+        parser.add_argument("--batch-size", type=int, default=100,
+                            help="Через сколько файлов сбрасывать кэш")
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field("image").storage
+        names = Post.objects.exclude(image="").exclude(
+            image__isnull=True
+        ).values_list("image", flat=True).distinct().iterator()
+        legacy = [name for name in names if not is_addressed(name)]
+        moved, missing, scopes = [], 0, set()
+        for name in legacy:
+            if not storage.exists(name):
+                missing += 1
+                continue
+            with storage.open(name) as source:
+                new_name = storage.save(name, File(source, name))
+            if not options["no_thumbnails"]:
+                # Страницы не должны показывать заглушку после переключения
+                thumbnails.generate(new_name)
+            # Один UPDATE: читатели видят либо старый файл, либо уже
+            # записанный новый
+            count = Post.objects.filter(image=name).update(image=new_name)
+            if count == 0:
+                storage.delete(new_name)
+                continue
+            if count > 1:
+                storage.retain(new_name, count - 1)
+            moved.append(name)
+            for post in Post.objects.filter(image=new_name).only(
+                "pk", "author_id", "group_id"
+            ):
+                scopes.update(post_scopes(post))
+            if len(moved) % options["batch_size"] == 0:
+                self.invalidate(scopes)
+        self.invalidate(scopes)
+
+        deleted = 0
+        if options["delete_old"]:
+            for name in moved:
+                if Post.objects.filter(image=name).exists():
+                    continue
+                delete(name, delete_file=False)
+                storage.delete_legacy(name)
+                deleted += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Перенесено файлов: {len(moved)}, не найдено: {missing}, "
+            f"удалено старых: {deleted}"
+        ))
+
+    def invalidate(self, scopes):
+        if scopes:
+            bump_feed_version()
+            touch(*scopes)
+            scopes.clear()
@@ -0,0 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ("Обрабатывает картинки постов (posts.images): уменьшает, "
+            "пересжимает без метаданных, записывает размеры и заново "
+            "создаёт миниатюры")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true",
+                            help="Обработать и уже обработанные картинки")
+        parser.add_argument("--workers", type=int, default=4,
+                            help="Число потоков; 1 — без пула")
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image="").exclude(image__isnull=True)
+        if not options["all"]:
+            posts = posts.filter(image_width__isnull=True)
+        rows = posts.values_list("pk", "image").iterator()
+        if options["workers"] > 1:
+            with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+                results = list(pool.map(
+                    lambda row: thumbnails.process_in_thread(*row), rows
+                ))
+        else:
+            results = [thumbnails.process(*row) for row in rows]
+        self.stdout.write(self.style.SUCCESS(
+            f"Обработано картинок: {results.count(True)}, "
+            f"ошибок: {results.count(False)}"
+        ))
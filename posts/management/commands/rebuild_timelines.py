@@ -0,0 +1,27 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+from posts.cache import bump_count_version
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Пересобирает материализованные ленты подписок с нуля"
+
+    def add_arguments(self, parser):
+        parser.add_argument("usernames", nargs="*",
+                            help="Пересобрать только ленты этих пользователей")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        users = None
+        if options["usernames"]:
+            users = User.objects.filter(username__in=options["usernames"])
+        created = timeline.rebuild(users, batch_size=options["batch_size"])
+        bump_count_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Записей в лентах: {created}"
+        ))
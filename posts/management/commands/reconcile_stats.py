@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import UserStats, recount_comments
+
+
+class Command(BaseCommand):
+    help = ("Пересчитывает счётчики постов, комментариев и подписок "
+            "и исправляет расхождения")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        users = UserStats.objects.counted_users().order_by("pk").values(
+            "pk", *UserStats.COUNTERS
+        )
+        created = updated = 0
+        batch = []
+        for row in users.iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) == batch_size:
+                created, updated = self.repair(batch, created, updated)
+                batch = []
+        if batch:
+            created, updated = self.repair(batch, created, updated)
+        posts = recount_comments()
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано записей: {created}, исправлено: {updated}, "
+            f"исправлено счётчиков комментариев: {posts}"
+        ))
+
+    def repair(self, rows, created, updated):
+        existing = UserStats.objects.in_bulk([row["pk"] for row in rows])
+        to_create, to_update = [], []
+        for row in rows:
+            counters = {field: row[field] for field in UserStats.COUNTERS}
+            stats = existing.get(row["pk"])
+            if stats is None:
+                to_create.append(UserStats(user_id=row["pk"], **counters))
+                continue
+            if any(getattr(stats, field) != value
+                   for field, value in counters.items()):
+                for field, value in counters.items():
+                    setattr(stats, field, value)
+                to_update.append(stats)
+        UserStats.objects.bulk_create(to_create, ignore_conflicts=True)
+        UserStats.objects.bulk_update(to_update, UserStats.COUNTERS)
+        return created + len(to_create), updated + len(to_update)
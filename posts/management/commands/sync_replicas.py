@@ -0,0 +1,33 @@
+import os
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = ("Копирует базу SQLite default в файлы реплик из "
+            "DATABASE_REPLICAS (для локальной проверки posts.replicas)")
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("Реплик нет: задайте YATUBE_REPLICAS")
+        source = sqlite3.connect(connections["default"].settings_dict["NAME"])
+        try:
+            for alias in settings.DATABASE_REPLICAS:
+                path = connections[alias].settings_dict["NAME"]
+                connections[alias].close()
+                # Копия собирается рядом и подменяет файл целиком:
+                # открытые соединения дочитывают старую версию
+                temporary = f"{path}.tmp"
+                target = sqlite3.connect(temporary)
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                os.replace(temporary, path)
+                self.stdout.write(f"{alias}: {path}")
+        finally:
+            source.close()
+        self.stdout.write(self.style.SUCCESS("Реплики обновлены"))
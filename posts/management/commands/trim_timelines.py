@@ -0,0 +1,29 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+from posts.cache import bump_count_version
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ("Обрезает материализованные ленты подписок до TIMELINE_LENGTH "
+            "постов; запускается по расписанию")
+
+    def add_arguments(self, parser):
+        parser.add_argument("usernames", nargs="*",
+                            help="Обрезать только ленты этих пользователей")
+
+    def handle(self, *args, **options):
+        users = None
+        if options["usernames"]:
+            users = User.objects.filter(
+                username__in=options["usernames"]
+            ).values_list("pk", flat=True)
+        deleted = timeline.trim_all(users)
+        bump_count_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Удалено записей из лент: {deleted}"
+        ))
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                "CREATE VIRTUAL TABLE posts_post_fts USING fts5("
+                "text, tokenize='unicode61 remove_diacritics 2')",
+                "CREATE VIRTUAL TABLE posts_comment_fts USING fts5("
+                "text, post_id UNINDEXED, "
+                "tokenize='unicode61 remove_diacritics 2')",
+                "INSERT INTO posts_post_fts (rowid, text) "
+                "SELECT id, text FROM posts_post",
+                "INSERT INTO posts_comment_fts (rowid, text, post_id) "
+                "SELECT id, text, post_id FROM posts_comment",
+            ],
+            reverse_sql=[
+                "DROP TABLE posts_comment_fts",
+                "DROP TABLE posts_post_fts",
+            ],
+        ),
+    ]
@@ -1,6 +1,9 @@
-from django.db import models
+from django.db import models, router, transaction, IntegrityError
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 
+from .storage import post_images
+
 
 User = get_user_model()
 
@@ -14,6 +17,23 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Всё, что нужно карточке поста, одним запросом."""
+        return self.select_related("author", "group")
+
+    def timeline(self, user):
+        """Лента подписок пользователя из материализованной таблицы.
+
+        Ключ сортировки берётся из самой ленты, чтобы страница читалась
+        обратным проходом по индексу (user, pub_date, post).
+        """
+        return self.filter(timeline_entries__user=user).annotate(
+            feed_date=models.F("timeline_entries__pub_date"),
+            feed_post=models.F("timeline_entries__post"),
+        )
+
+
 class Post(models.Model):
     text = models.TextField("Текст",
                             help_text="Не забудте проверить орфографию, "
@@ -31,16 +51,45 @@ class Post(models.Model):
                               help_text="Выберете сообщество. Если хотите."
                               )
     image = models.ImageField(upload_to="posts/",
+                              storage=post_images,
                               blank=True,
                               null=True,
                               verbose_name="Изображение"
                               )
+    # Заполняются после обработки картинки (posts.images)
+    image_width = models.PositiveIntegerField(null=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, editable=False)
+    comments_count = models.IntegerField(default=0, editable=False)
+    # Версия кэшированной карточки поста (posts.cards)
+    card_version = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
+
+    # Меняются только UPDATE с F() (posts.signals); в объекте из памяти
+    # они могут быть устаревшими, поэтому обычный save их не пишет
+    COUNTERS = ("comments_count", "card_version")
 
     def __str__(self):
         return self.text
 
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not kwargs.get("force_insert")
+                and kwargs.get("update_fields") is None and not args):
+            kwargs["update_fields"] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTERS
+            ]
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ("-pub_date",)
+        indexes = [
+            models.Index(fields=["pub_date"], name="post_date_idx"),
+            models.Index(fields=["author", "pub_date"],
+                         name="post_author_date_idx"),
+            models.Index(fields=["group", "pub_date"],
+                         name="post_group_date_idx"),
+        ]
 
 
 class Comment(models.Model):
@@ -63,6 +112,13 @@ class Comment(models.Model):
     def __str__(self):
         return self.text
 
+    class Meta:
+        ordering = ("created",)
+        indexes = [
+            models.Index(fields=["post", "created"],
+                         name="comment_post_created_idx"),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -78,3 +134,125 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ("user", "author")
+        indexes = [
+            models.Index(fields=["author", "user"],
+                         name="follow_author_user_idx"),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """Материализованная лента подписок: строка на пару (читатель, пост).
+
+    pub_date копируется из поста, чтобы лента читалась диапазоном
+    по индексу (user, pub_date) без соединения с Follow.
+    """
+    user = models.ForeignKey(
+        User,
+        related_name="timeline",
+        on_delete=models.CASCADE
+    )
+    post = models.ForeignKey(
+        Post,
+        related_name="timeline_entries",
+        on_delete=models.CASCADE
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("user", "post")
+        indexes = [
+            models.Index(fields=["user", "pub_date", "post"],
+                         name="timeline_user_date_post_idx"),
+        ]
+
+
+def _count(model, field):
+    return Coalesce(models.Subquery(
+        model.objects.filter(**{field: models.OuterRef("pk")}).order_by(
+        ).values(field).annotate(count=models.Count("pk")).values("count")
+    ), 0)
+
+
+def recount_comments():
+    """Исправляет Post.comments_count одним UPDATE; возвращает число
+    исправленных постов."""
+    counted = _count(Comment, "post")
+    return Post.objects.exclude(comments_count=counted).update(
+        comments_count=counted
+    )
+
+
+class UserStatsManager(models.Manager):
+    def counted_users(self):
+        """Пользователи с пересчитанными счётчиками из исходных таблиц."""
+        return User.objects.annotate(
+            posts_count=_count(Post, "author"),
+            followers_count=_count(Follow, "author"),
+            followings_count=_count(Follow, "user"),
+        )
+
+    def for_user(self, user):
+        """Счётчики пользователя (объект или id); при первом обращении
+        считаются заново.
+
+        Подсчёт и вставка идут одной транзакцией на базе для записи: в
+        posts.db это BEGIN IMMEDIATE, поэтому пост или подписка не могут
+        появиться между подсчётом и вставкой, а их bump либо уже учтён
+        подсчётом, либо придёт после вставки.
+        """
+        user_id = getattr(user, "pk", user)
+        try:
+            return self.get(user_id=user_id)
+        except self.model.DoesNotExist:
+            pass
+        db = router.db_for_write(self.model)
+        with transaction.atomic(using=db):
+            stats = self.using(db).filter(user_id=user_id).first()
+            if stats is not None:
+                return stats
+            counted = self.counted_users().using(db).get(pk=user_id)
+            stats = self.model(user_id=user_id, **{
+                field: getattr(counted, field)
+                for field in self.model.COUNTERS
+            })
+            try:
+                with transaction.atomic(using=db):
+                    stats.save(force_insert=True, using=db)
+            except IntegrityError:
+                return self.using(db).get(user_id=user_id)
+        return stats
+
+    def bump(self, user_id, field, delta):
+        """Атомарно меняет счётчик на delta одним UPDATE.
+
+        Если записи ещё нет, она создаётся подсчётом в той же транзакции,
+        что и изменение, которое вызвало bump: подсчёт его уже видит.
+        """
+        updated = self.filter(user_id=user_id).update(
+            **{field: models.F(field) + delta}
+        )
+        if not updated:
+            self.for_user(user_id)
+
+
+class UserStats(models.Model):
+    """Денормализованные счётчики для профиля и страницы поста."""
+    COUNTERS = ("posts_count", "followers_count", "followings_count")
+
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        related_name="stats",
+        on_delete=models.CASCADE
+    )
+    posts_count = models.IntegerField(default=0)
+    followers_count = models.IntegerField(default=0)
+    followings_count = models.IntegerField(default=0)
+
+    objects = UserStatsManager()
+
+
+class StoredFile(models.Model):
+    """Число ссылок на файл в хранилище posts.storage."""
+    name = models.CharField(max_length=255, primary_key=True)
+    refs = models.PositiveIntegerField(default=0)
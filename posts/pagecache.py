@@ -0,0 +1,86 @@
+"""Кэш целых страниц для анонимных посетителей.
+
+Запись хранит ответ, время начала рендера и список scopes, от которых
+страница зависит: scopes самого view (posts.conditional) плюс пост,
+автор и группа каждой карточки на странице ({% post_card post %}).
+Запись действительна, пока ни один из этих scopes не менялся
+(posts.cache.touch) после начала рендера, поэтому изменение поста,
+комментария или подписки сбрасывает ровно те страницы, где они видны.
+Страница для кэша рендерится на default, даже если view читает с
+реплики (posts.replicas).
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from . import replicas
+from .cache import last_changed
+
+
+def page_key(request):
+    path = request.get_full_path().encode()
+    return f"page:{hashlib.md5(path).hexdigest()}"
+
+
+def depend(request, *scopes):
+    """Добавляет scopes к зависимостям страницы, которая рендерится
+    для кэша. В остальных запросах ничего не делает."""
+    deps = getattr(request, "_page_deps", None)
+    if deps is not None:
+        deps.update(scopes)
+
+
+def post_dependencies(post):
+    scopes = [f"post:{post.pk}", f"author:{post.author_id}"]
+    if post.group_id is not None:
+        scopes.append(f"group:{post.group_id}")
+    return scopes
+
+
+def cacheable(request, response):
+    return (response.status_code == 200
+            and not response.cookies
+            and not getattr(response, "streaming", False)
+            and not request.META.get("CSRF_COOKIE_USED"))
+
+
+def cached_page(scopes):
+    """Кэширует ответы view для анонимных GET-запросов.
+
+    scopes — та же функция, что и для posts.conditional.conditional;
+    None (объекта нет) — страница не кэшируется.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD") or (
+                request.user.is_authenticated
+            ):
+                return view(request, *args, **kwargs)
+            with replicas.primary():
+                names = scopes(request, *args, **kwargs)
+            if names is None:
+                return view(request, *args, **kwargs)
+            key = page_key(request)
+            entry = cache.get(key)
+            if entry is not None:
+                started, deps, content, content_type = entry
+                if last_changed(*deps) <= started:
+                    return HttpResponse(content, content_type=content_type)
+            # Время берётся до чтения данных: изменение во время рендера
+            # сделает запись недействительной
+            started = time.time()
+            request._page_deps = set(names)
+            with replicas.primary():
+                response = view(request, *args, **kwargs)
+            if cacheable(request, response):
+                cache.set(key, (started, sorted(request._page_deps),
+                                response.content, response["Content-Type"]),
+                          settings.PAGE_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,195 @@
+import base64
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from . import replicas
+from .cache import count_version
+
+
+# Ключ курсора: (pub_date, id). id разрешает совпадения дат публикации.
+CURSOR_KEY = ("pub_date", "id")
+# Больший id SQLite не примет в запросе (OverflowError)
+MAX_ID = 2 ** 63 - 1
+
+
+def cursor_ordering(key=CURSOR_KEY):
+    return tuple(f"-{field}" for field in key)
+
+
+def encode_position(date, pk):
+    raw = f"{date.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def encode_cursor(obj, field="pub_date"):
+    return encode_position(getattr(obj, field), obj.pk)
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        pub_date, pk = raw.decode().rsplit("|", 1)
+        pub_date, pk = parse_datetime(pub_date), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if pub_date is None or not 0 <= pk <= MAX_ID:
+        return None
+    return pub_date, pk
+
+
+class CursorPage:
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f"<CursorPage of {len(self.object_list)} items>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+
+class CursorPaginator:
+    """Постраничный вывод без COUNT(*) и OFFSET: страница начинается
+    сразу за записью, закодированной в курсоре.
+
+    По умолчанию сначала новые записи; descending=False — сначала
+    старые (комментарии).
+    """
+
+    def __init__(self, object_list, per_page, key=CURSOR_KEY,
+                 descending=True):
+        self.ordering = cursor_ordering(key) if descending else tuple(key)
+        self.reverse_ordering = tuple(key) if descending else (
+            cursor_ordering(key)
+        )
+        self.object_list = object_list.order_by(*self.ordering)
+        self.per_page = per_page
+        self.date_field, self.id_field = key
+        self.forward, self.backward = (
+            ("lt", "gt") if descending else ("gt", "lt")
+        )
+
+    def get_page(self, after=None, before=None):
+        position = decode_cursor(before)
+        if position is not None:
+            return self._page_before(*position)
+        position = decode_cursor(after)
+        if position is not None:
+            return self._page_after(*position)
+        return self._first_page()
+
+    def _first_page(self):
+        rows = list(self.object_list[:self.per_page + 1])
+        return CursorPage(rows[:self.per_page],
+                          has_next=len(rows) > self.per_page,
+                          has_previous=False)
+
+    def _page_after(self, pub_date, pk):
+        rows = list(self.object_list.filter(
+            Q(**{f"{self.date_field}__{self.forward}": pub_date})
+            | Q(**{self.date_field: pub_date,
+                   f"{self.id_field}__{self.forward}": pk})
+        )[:self.per_page + 1])
+        return CursorPage(rows[:self.per_page],
+                          has_next=len(rows) > self.per_page,
+                          has_previous=True)
+
+    def _page_before(self, pub_date, pk):
+        rows = list(self.object_list.filter(
+            Q(**{f"{self.date_field}__{self.backward}": pub_date})
+            | Q(**{self.date_field: pub_date,
+                   f"{self.id_field}__{self.backward}": pk})
+        ).order_by(*self.reverse_ordering)[:self.per_page + 1])
+        if len(rows) <= self.per_page:
+            # Дошли до начала ленты: отдаём полную первую страницу.
+            return self._first_page()
+        return CursorPage(rows[:self.per_page][::-1],
+                          has_next=True,
+                          has_previous=True)
+
+
+def cached_count(queryset):
+    """COUNT(*) ленты из кэша.
+
+    Ключ зависит от SQL запроса и версии числа постов (count_version),
+    которая меняется при каждом изменении состава лент, поэтому число
+    всегда точное: Paginator обрезает страницы по нему. Таймаут лишь
+    ограничивает время жизни записей в кэше.
+    """
+    sql = str(queryset.query).encode()
+    key = f"feed:count:{count_version()}:{hashlib.md5(sql).hexdigest()}"
+    count = cache.get(key)
+    if count is None:
+        # Число с отстающей реплики не совпало бы с версией счётчика
+        with replicas.primary():
+            count = queryset.count()
+        cache.set(key, count, settings.PAGINATOR_COUNT_TIMEOUT)
+    return count
+
+
+def page_window(page, on_each_side=2, on_ends=1):
+    """Номера страниц вокруг текущей плюс первые и последние;
+    None на месте пропущенных."""
+    number = page.number
+    num_pages = page.paginator.num_pages
+    if num_pages <= (on_each_side + on_ends) * 2 + 1:
+        return list(range(1, num_pages + 1))
+    window = []
+    if number > on_each_side + on_ends + 1:
+        window.extend(range(1, on_ends + 1))
+        window.append(None)
+        window.extend(range(number - on_each_side, number + 1))
+    else:
+        window.extend(range(1, number + 1))
+    if number < num_pages - on_each_side - on_ends:
+        window.extend(range(number + 1, number + on_each_side + 1))
+        window.append(None)
+        window.extend(range(num_pages - on_ends + 1, num_pages + 1))
+    else:
+        window.extend(range(number + 1, num_pages + 1))
+    return window
+
+
+def paginate(request, object_list, per_page, key=CURSOR_KEY):
+    """Возвращает (paginator, page) для ленты.
+
+    При наличии ?after=/?before= используется курсорная навигация,
+    иначе — обычный Paginator по ?page=, чтобы старые ссылки работали.
+    key — пара полей (или аннотаций) с датой публикации и id поста,
+    по которым строится курсор.
+    """
+    after = request.GET.get("after")
+    before = request.GET.get("before")
+    if after or before:
+        paginator = CursorPaginator(object_list, per_page, key)
+        return paginator, paginator.get_page(after=after, before=before)
+    paginator = Paginator(
+        object_list.order_by(*cursor_ordering(key)), per_page
+    )
+    # count у Paginator — cached_property, подставляем значение из кэша
+    paginator.count = cached_count(object_list)
+    return paginator, paginator.get_page(request.GET.get("page"))
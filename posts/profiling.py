@@ -0,0 +1,153 @@
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.template.base import Template
+
+
+# Кадр рендеринга шаблона: в стек вместо него пишется имя шаблона,
+# чтобы на flame graph было видно, какой include дорогой.
+_TEMPLATE_RENDER = Template._render.__code__
+
+
+def frame_label(frame):
+    code = frame.f_code
+    if code is _TEMPLATE_RENDER:
+        template = frame.f_locals.get("self")
+        name = getattr(getattr(template, "origin", None), "template_name",
+                       None)
+        return f"template:{name or '<string>'}"
+    filename = code.co_filename
+    for path in sys.path:
+        if path and filename.startswith(path):
+            filename = filename[len(path):].lstrip(os.sep)
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def collapse(frame):
+    """Стек в формате collapsed stacks: от корня к листу через «;»."""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame).replace(";", ":"))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class Sampler:
+    """Фоновый поток, который раз в PROFILING_INTERVAL секунд снимает
+    стеки потоков, обрабатывающих профилируемые запросы."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = {}
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def start(self, thread_id):
+        stacks = Counter()
+        with self.lock:
+            self.active[thread_id] = stacks
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name="profiler", daemon=True
+                )
+                self.thread.start()
+        self.wakeup.set()
+        return stacks
+
+    def stop(self, thread_id):
+        with self.lock:
+            return self.active.pop(thread_id, Counter())
+
+    def run(self):
+        while True:
+            if not self.active:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+            time.sleep(settings.PROFILING_INTERVAL)
+            frames = sys._current_frames()
+            with self.lock:
+                active = list(self.active.items())
+            for thread_id, stacks in active:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    stacks[collapse(frame)] += 1
+
+
+sampler = Sampler()
+
+
+def view_directory(view_name):
+    return os.path.join(settings.PROFILING_DIR,
+                        re.sub(r"[^\w.-]", "_", view_name))
+
+
+def write_stacks(view_name, stacks):
+    directory = view_directory(view_name)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory,
+                        f"{time.time_ns()}-{os.getpid()}.folded")
+    with open(path, "w") as file:
+        for stack, count in stacks.items():
+            file.write(f"{stack} {count}\n")
+    return path
+
+
+def read_stacks(path):
+    stacks = Counter()
+    with open(path) as file:
+        for line in file:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if stack:
+                stacks[stack] += int(count)
+    return stacks
+
+
+class ProfilingMiddleware:
+    """Сэмплирующий профайлер для части запросов.
+
+    Профилируется доля PROFILING_SAMPLE_RATE запросов, запросы к путям
+    из PROFILING_PATHS и запросы с заголовком PROFILING_HEADER от
+    INTERNAL_IPS или персонала. Стеки пишутся в
+    PROFILING_DIR/<view>/*.folded, manage.py merge_profiles их сводит.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.paths = [re.compile(pattern)
+                      for pattern in settings.PROFILING_PATHS]
+        self.header = "HTTP_" + settings.PROFILING_HEADER.upper().replace(
+            "-", "_"
+        )
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+        thread_id = threading.get_ident()
+        sampler.start(thread_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            stacks = sampler.stop(thread_id)
+        match = request.resolver_match
+        if stacks and match:
+            write_stacks(match.view_name, stacks)
+        return response
+
+    def should_profile(self, request):
+        if request.META.get(self.header) and (
+            request.META.get("REMOTE_ADDR") in settings.INTERNAL_IPS
+            or getattr(request, "user", None) and request.user.is_staff
+        ):
+            return True
+        if any(pattern.search(request.path) for pattern in self.paths):
+            return True
+        rate = settings.PROFILING_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
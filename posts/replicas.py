@@ -0,0 +1,121 @@
+"""Чтение с реплик базы для страниц, которые ничего не пишут.
+
+ReplicaMiddleware отмечает запрос к view из REPLICA_VIEWS, и
+ReplicaRouter отправляет его чтения на случайную реплику из
+DATABASE_REPLICAS. Любая запись идёт в default; после неё чтения
+этого запроса тоже идут в default, а посетитель получает cookie,
+которая REPLICA_PIN_SECONDS секунд держит его на default: свои посты,
+комментарии и подписки он видит сразу, даже если реплика отстаёт.
+
+    DATABASE_ROUTERS = ["posts.replicas.ReplicaRouter"]
+    DATABASE_REPLICAS = ["replica1", "replica2"]
+
+Данные с отстающей реплики нельзя сохранять в общие кэши: их ключи и
+отметки (posts.cache) уже отражают состояние default. Поэтому всё, что
+рендерится для кэша, читается внутри primary(), а ответ, для которого
+читалась реплика, уходит без ETag и Last-Modified. Сессии и
+пользователи всегда читаются из default (PRIMARY_APPS).
+
+Для локальной проверки реплики — копии файла SQLite
+(manage.py sync_replicas).
+"""
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+_local = threading.local()
+
+# Отставание здесь разлогинивает посетителя или пускает по старому паролю
+PRIMARY_APPS = {"auth", "sessions"}
+
+
+def replicas():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+def use_replica(enabled=True):
+    """Разрешает или запрещает чтение с реплик в текущем потоке."""
+    _local.replica = enabled
+
+
+def wrote():
+    return getattr(_local, "wrote", False)
+
+
+def used():
+    """Читал ли текущий запрос с реплики."""
+    return getattr(_local, "used", False)
+
+
+@contextmanager
+def primary():
+    """Чтения внутри блока идут в default."""
+    enabled = getattr(_local, "replica", False)
+    _local.replica = False
+    try:
+        yield
+    finally:
+        _local.replica = enabled
+
+
+def reset():
+    _local.replica = False
+    _local.wrote = False
+    _local.used = False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (not getattr(_local, "replica", False) or wrote()
+                or model._meta.app_label in PRIMARY_APPS):
+            return DEFAULT_DB_ALIAS
+        names = replicas()
+        if not names:
+            return DEFAULT_DB_ALIAS
+        _local.used = True
+        return random.choice(names)
+
+    def db_for_write(self, model, **hints):
+        _local.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии default: объекты с них связываются свободно
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик приходит вместе с данными из default
+        return db not in replicas()
+
+
+class ReplicaMiddleware:
+    """Включает ReplicaRouter для GET-запросов к REPLICA_VIEWS."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reset()
+        try:
+            response = self.get_response(request)
+            if wrote() and replicas():
+                response.set_cookie(settings.REPLICA_PIN_COOKIE, "1",
+                                    max_age=settings.REPLICA_PIN_SECONDS,
+                                    httponly=True, samesite="Lax")
+        finally:
+            reset()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = f"{view_func.__module__}.{view_func.__name__}"
+        if (request.method in ("GET", "HEAD")
+                and view in settings.REPLICA_VIEWS
+                and settings.REPLICA_PIN_COOKIE not in request.COOKIES):
+            use_replica()
@@ -0,0 +1,108 @@
+import unicodedata
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+
+# Полнотекстовый индекс SQLite FTS5 (см. миграцию 0009_search).
+# Таблицы хранят копию текста, поэтому snippet() работает без JOIN,
+# а синхронизация с постами и комментариями идёт через сигналы.
+POST_TABLE = "posts_post_fts"
+COMMENT_TABLE = "posts_comment_fts"
+
+# Маркеры подсветки: в тексте их не бывает, и они переживают escape().
+MARK_START, MARK_END = "\x02", "\x03"
+SNIPPET_TOKENS = 16
+
+
+def fts_query(text):
+    """Пользовательский ввод -> запрос FTS5: каждое слово как префикс,
+    все слова обязательны. Синтаксис FTS5 из ввода не пропускается,
+    управляющие символы (FTS5 не принимает, например, NUL) удаляются."""
+    words = ["".join(
+        char for char in word if unicodedata.category(char)[0] != "C"
+    ).replace('"', '""') for word in text.split()]
+    return " ".join(f'"{word}"*' for word in words if word)
+
+
+def highlight(snippet):
+    return mark_safe(escape(snippet).replace(
+        MARK_START, "<mark>"
+    ).replace(MARK_END, "</mark>"))
+
+
+def search(text, limit, offset=0):
+    """Посты, совпавшие по тексту поста или его комментариев.
+
+    Возвращает список (post_id, snippet) по убыванию релевантности
+    (bm25); в snippet найденные слова выделены <mark>.
+    """
+    query = fts_query(text)
+    if not query:
+        return []
+    snippet_args = (MARK_START, MARK_END, "…", SNIPPET_TOKENS)
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT post_id, MIN(rank), snippet FROM (
+                SELECT rowid AS post_id, bm25({POST_TABLE}) AS rank,
+                       snippet({POST_TABLE}, 0, %s, %s, %s, %s) AS snippet
+                FROM {POST_TABLE} WHERE {POST_TABLE} MATCH %s
+                UNION ALL
+                SELECT post_id, bm25({COMMENT_TABLE}) AS rank,
+                       snippet({COMMENT_TABLE}, 0, %s, %s, %s, %s)
+                FROM {COMMENT_TABLE} WHERE {COMMENT_TABLE} MATCH %s
+            )
+            GROUP BY post_id
+            ORDER BY MIN(rank), post_id DESC
+            LIMIT %s OFFSET %s
+        """, (*snippet_args, query, *snippet_args, query, limit, offset))
+        return [(post_id, highlight(snippet))
+                for post_id, _, snippet in cursor.fetchall()]
+
+
+def matching(table, text):
+    """Подзапрос с rowid совпавших строк, для filter(pk__in=...)."""
+    return RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s",
+                  (fts_query(text),))
+
+
+def index_post(post):
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {POST_TABLE} WHERE rowid = %s",
+                       (post.pk,))
+        cursor.execute(
+            f"INSERT INTO {POST_TABLE} (rowid, text) VALUES (%s, %s)",
+            (post.pk, post.text)
+        )
+
+
+def index_comment(comment):
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {COMMENT_TABLE} WHERE rowid = %s",
+                       (comment.pk,))
+        cursor.execute(
+            f"INSERT INTO {COMMENT_TABLE} (rowid, text, post_id) "
+            f"VALUES (%s, %s, %s)",
+            (comment.pk, comment.text, comment.post_id)
+        )
+
+
+def unindex(table, pk):
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE rowid = %s", (pk,))
+
+
+def rebuild():
+    """Заполняет индекс заново из posts_post и posts_comment."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {POST_TABLE}")
+        cursor.execute(f"INSERT INTO {POST_TABLE} (rowid, text) "
+                       f"SELECT id, text FROM posts_post")
+        cursor.execute(f"DELETE FROM {COMMENT_TABLE}")
+        cursor.execute(f"INSERT INTO {COMMENT_TABLE} (rowid, text, post_id) "
+                       f"SELECT id, text, post_id FROM posts_comment")
+        for table in (POST_TABLE, COMMENT_TABLE):
+            cursor.execute(f"INSERT INTO {table} ({table}) "
+                           f"VALUES ('optimize')")
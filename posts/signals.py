@@ -0,0 +1,186 @@
+from django.db.models import F
+from django.core.cache import cache
+from django.db.models.signals import (post_save, post_delete, post_migrate,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import search, timeline
+from .auth import forget_user
+from .cache import bump_count_version, bump_feed_version, touch
+from .models import Post, Group, Comment, Follow, UserStats, User
+
+
+def post_scopes(post):
+    scopes = ["posts", f"post:{post.pk}", f"author:{post.author_id}"]
+    for group_id in {post.group_id, getattr(post, "_previous_group_id",
+                                             None)}:
+        if group_id is not None:
+            scopes.append(f"group:{group_id}")
+    return scopes
+
+
+def bump_card(**filters):
+    Post.objects.filter(**filters).update(card_version=F("card_version") + 1)
+
+
+def post_changed(post_id):
+    """Сбрасывает кэши страниц поста, изменённого в обход сигналов."""
+    bump_card(pk=post_id)
+    post = Post.objects.filter(pk=post_id).first()
+    if post is not None:
+        bump_feed_version()
+        touch(*post_scopes(post))
+
+
+def comment_scopes(comment):
+    scopes = ["posts", f"post:{comment.post_id}"]
+    author_id = Post.objects.filter(pk=comment.post_id).values_list(
+        "author_id", flat=True
+    ).first()
+    if author_id is not None:
+        scopes.append(f"author:{author_id}")
+    return scopes
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, raw=False, **kwargs):
+    # Пост могли перенести в другую группу: её страница тоже меняется.
+    # Прежнюю картинку после сохранения нужно отпустить в хранилище.
+    if instance.pk and not raw:
+        instance._previous_group_id, instance._previous_image = (
+            Post.objects.filter(pk=instance.pk).values_list(
+                "group_id", "image"
+            ).first() or (None, None)
+        )
+    # Загруженный файл сохраняется в хранилище уже после этого сигнала
+    instance._image_uploaded = bool(instance.image) and (
+        not instance.image._committed
+    )
+
+
+def release_image(name):
+    if name:
+        Post._meta.get_field("image").storage.delete(name)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    bump_feed_version()
+    previous_group_id = getattr(instance, "_previous_group_id",
+                                instance.group_id)
+    if created or previous_group_id != instance.group_id:
+        bump_count_version()
+    touch(*post_scopes(instance))
+    search.index_post(instance)
+    if not created and not raw:
+        bump_card(pk=instance.pk)
+    previous = getattr(instance, "_previous_image", None)
+    if previous != instance.image.name:
+        release_image(previous)
+        instance._previous_image = instance.image.name
+    elif getattr(instance, "_image_uploaded", False):
+        # Загрузили тот же файл: хранилище взяло на него ещё одну ссылку
+        release_image(previous)
+    if created and not raw:
+        timeline.fan_out(instance)
+        UserStats.objects.bump(instance.author_id, "posts_count", 1)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    bump_feed_version()
+    bump_count_version()
+    touch(*post_scopes(instance))
+    search.unindex(search.POST_TABLE, instance.pk)
+    UserStats.objects.bump(instance.author_id, "posts_count", -1)
+    release_image(instance.image.name)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, **kwargs):
+    # Название группы есть в карточках постов всех лент: меняются
+    # главная, страница группы и страницы авторов её постов
+    bump_card(group_id=instance.pk)
+    bump_feed_version()
+    authors = Post.objects.filter(group=instance).order_by().values_list(
+        "author_id", flat=True
+    ).distinct()
+    touch("posts", f"group:{instance.pk}",
+          *(f"author:{author_id}" for author_id in authors))
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    search.index_comment(instance)
+    touch(*comment_scopes(instance))
+    if created and not raw:
+        Post.objects.filter(pk=instance.post_id).update(
+            comments_count=F("comments_count") + 1,
+            card_version=F("card_version") + 1,
+        )
+        bump_feed_version()
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    search.unindex(search.COMMENT_TABLE, instance.pk)
+    touch(*comment_scopes(instance))
+    Post.objects.filter(pk=instance.post_id).update(
+        comments_count=F("comments_count") - 1,
+        card_version=F("card_version") + 1,
+    )
+    bump_feed_version()
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.backfill(instance.user_id, instance.author_id)
+        bump_feed_version()
+        bump_count_version()
+        touch(f"author:{instance.author_id}", f"author:{instance.user_id}")
+        UserStats.objects.bump(instance.author_id, "followers_count", 1)
+        UserStats.objects.bump(instance.user_id, "followings_count", 1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    timeline.remove(instance.user_id, instance.author_id)
+    bump_feed_version()
+    bump_count_version()
+    touch(f"author:{instance.author_id}", f"author:{instance.user_id}")
+    UserStats.objects.bump(instance.author_id, "followers_count", -1)
+    UserStats.objects.bump(instance.user_id, "followings_count", -1)
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Вход пользователя сохраняет только last_login
+    if instance.pk and not raw and (
+        update_fields is None or "username" in update_fields
+    ):
+        instance._previous_username = User.objects.filter(
+            pk=instance.pk
+        ).values_list("username", flat=True).first()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # Пользователь запроса берётся из кэша (posts.auth)
+    forget_user(instance.pk)
+    previous = getattr(instance, "_previous_username", None)
+    if previous is not None and previous != instance.username:
+        # Имя и ссылка на профиль есть в карточках всех постов автора
+        bump_card(author_id=instance.pk)
+        bump_feed_version()
+        touch("posts", f"author:{instance.pk}")
+        instance._previous_username = instance.username
+
+
+@receiver(post_migrate)
+def migrated(sender, **kwargs):
+    """Кэш общий для процессов и переживает перезапуск, а миграции
+    меняют данные в обход сигналов, поэтому после них кэш сбрасывается."""
+    if sender.name == "posts":
+        cache.clear()
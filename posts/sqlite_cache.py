@@ -0,0 +1,234 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+# Сколько записей между проверками переполнения кэша
+CULL_EVERY = 100
+# Ограничение SQLite на число параметров в одном запросе
+CHUNK_SIZE = 500
+
+
+class SQLiteCache(BaseCache):
+    """Кэш в файле SQLite, общий для всех процессов сервера на хосте.
+
+    Файл открыт в режиме WAL, поэтому чтения не ждут записей, а
+    запись блокирует только другие записи. incr() и add() атомарны
+    между процессами. Целые числа хранятся как INTEGER, остальное —
+    pickle.
+
+        CACHES = {"default": {
+            "BACKEND": "posts.sqlite_cache.SQLiteCache",
+            "LOCATION": "/var/tmp/yatube-cache.sqlite3",
+            "OPTIONS": {"MAX_ENTRIES": 100000},
+        }}
+    """
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = location
+        options = params.get("OPTIONS", {})
+        self.busy_timeout = options.get("BUSY_TIMEOUT", 5)
+        self.mmap_size = options.get("MMAP_SIZE", 64 * 1024 * 1024)
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        # Соединение своё у каждого потока и у каждого процесса после fork
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.connection = self._connect()
+            local.pid = os.getpid()
+            local.writes = 0
+        return local.connection
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=self.busy_timeout,
+                                     isolation_level=None)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL"
+            ") WITHOUT ROWID"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)"
+        )
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _encode(self, value):
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def _decode(self, raw):
+        if isinstance(raw, int):
+            return raw
+        return pickle.loads(raw)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def get(self, key, default=None, version=None):
+        row = self.connection.execute(
+            "SELECT value FROM cache WHERE key = ? "
+            "AND (expires IS NULL OR expires > ?)",
+            (self._key(key, version), time.time())
+        ).fetchone()
+        return default if row is None else self._decode(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        found = {}
+        made = list(keys)
+        now = time.time()
+        for start in range(0, len(made), CHUNK_SIZE):
+            chunk = made[start:start + CHUNK_SIZE]
+            rows = self.connection.execute(
+                f"SELECT key, value FROM cache "
+                f"WHERE key IN ({', '.join('?' * len(chunk))}) "
+                f"AND (expires IS NULL OR expires > ?)",
+                (*chunk, now)
+            )
+            for key, raw in rows:
+                found[keys[key]] = self._decode(raw)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires) "
+            "VALUES (?, ?, ?)",
+            (self._key(key, version), self._encode(value),
+             self.get_backend_timeout(timeout))
+        )
+        self._wrote(1)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        with self._transaction() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, expires) "
+                "VALUES (?, ?, ?)",
+                [(self._key(key, version), self._encode(value), expires)
+                 for key, value in data.items()]
+            )
+        self._wrote(len(data))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        # Одна инструкция: вставка или замена только протухшей записи
+        cursor = self.connection.execute(
+            "INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET "
+            "value = excluded.value, expires = excluded.expires "
+            "WHERE cache.expires IS NOT NULL AND cache.expires <= ?",
+            (self._key(key, version), self._encode(value),
+             self.get_backend_timeout(timeout), now)
+        )
+        if cursor.rowcount:
+            self._wrote(1)
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT value FROM cache WHERE key = ? "
+                "AND (expires IS NULL OR expires > ?)", (key, time.time())
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = self._decode(row[0]) + delta
+            connection.execute("UPDATE cache SET value = ? WHERE key = ?",
+                               (self._encode(value), key))
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        cursor = self.connection.execute(
+            "UPDATE cache SET expires = ? WHERE key = ? "
+            "AND (expires IS NULL OR expires > ?)",
+            (self.get_backend_timeout(timeout), self._key(key, version),
+             time.time())
+        )
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        return self.connection.execute(
+            "SELECT 1 FROM cache WHERE key = ? "
+            "AND (expires IS NULL OR expires > ?)",
+            (self._key(key, version), time.time())
+        ).fetchone() is not None
+
+    def delete(self, key, version=None):
+        cursor = self.connection.execute(
+            "DELETE FROM cache WHERE key = ?", (self._key(key, version),)
+        )
+        return cursor.rowcount > 0
+
+    def delete_many(self, keys, version=None):
+        made = [self._key(key, version) for key in keys]
+        with self._transaction() as connection:
+            connection.executemany("DELETE FROM cache WHERE key = ?",
+                                   [(key,) for key in made])
+
+    def clear(self):
+        self.connection.execute("DELETE FROM cache")
+
+    def close(self, **kwargs):
+        # Django закрывает кэши после каждого запроса; соединение
+        # с файлом дешевле держать открытым.
+        pass
+
+    def _wrote(self, count):
+        local = self._local
+        local.writes += count
+        if local.writes >= CULL_EVERY:
+            local.writes = 0
+            self._cull()
+
+    def _cull(self):
+        """Удаляет протухшие записи, а при переполнении ещё и
+        1/CULL_FREQUENCY записей, которые истекут раньше других."""
+        with self._transaction() as connection:
+            connection.execute(
+                "DELETE FROM cache WHERE expires <= ?", (time.time(),)
+            )
+            count = connection.execute(
+                "SELECT COUNT(*) FROM cache"
+            ).fetchone()[0]
+            if count <= self._max_entries:
+                return
+            if not self._cull_frequency:
+                connection.execute("DELETE FROM cache")
+                return
+            connection.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY expires IS NULL, expires "
+                "LIMIT ?)", (count // self._cull_frequency,)
+            )
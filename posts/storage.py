@@ -0,0 +1,122 @@
+"""Хранилище картинок постов по хэшу содержимого.
+
+Файл сохраняется как <upload_to>/ab/cd/abcd…ef.jpg, где имя — SHA-256
+содержимого, а две первые пары символов — вложенные каталоги (по 256
+на уровень), так что в одном каталоге не собираются миллионы файлов.
+Одинаковые загрузки хранятся один раз; число ссылок на файл ведётся
+в posts.StoredFile, и delete() лишь снимает одну ссылку.
+"""
+import hashlib
+import os
+import posixpath
+import re
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+ADDRESSED = re.compile(
+    r"(?:.*/)?" + r"[0-9a-f]{%d}/" % SHARD_WIDTH * SHARD_LEVELS
+    + r"[0-9a-f]{64}(?:\.\w+)?$"
+)
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    if hasattr(content, "seek"):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, "seek"):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def addressed_name(name, digest):
+    """Имя в хранилище для файла name с хэшем содержимого digest."""
+    directory = posixpath.dirname(name)
+    if is_addressed(name):
+        # Новое содержимое уже адресованного файла (после обработки)
+        directory = posixpath.join(
+            *directory.split("/")[:-SHARD_LEVELS] or [""]
+        )
+    extension = os.path.splitext(name)[1].lower()
+    shards = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH]
+              for i in range(SHARD_LEVELS)]
+    return posixpath.join(directory, *shards, digest + extension)
+
+
+def is_addressed(name):
+    return bool(ADDRESSED.match(name or ""))
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage с адресацией по содержимому и подсчётом ссылок.
+
+    Файлы со старыми именами (до перехода, см. migrate_media) читаются
+    как обычно, но не учитываются и не удаляются.
+    """
+
+    @property
+    def _files(self):
+        return apps.get_model("posts", "StoredFile").objects
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        name = addressed_name(name, content_hash(content))
+        self.retain(name, 1, content)
+        return name
+
+    def retain(self, name, count, content=None):
+        """Добавляет count ссылок на name; файла ещё нет — пишет content."""
+        with transaction.atomic():
+            if self._files.filter(name=name).update(refs=F("refs") + count):
+                return
+            if not self.exists(name):
+                if content is None:
+                    raise FileNotFoundError(name)
+                saved = self._save(name, content)
+                if saved != name:
+                    # Тот же файл успел записать параллельный запрос
+                    super().delete(saved)
+            try:
+                with transaction.atomic():
+                    self._files.create(name=name, refs=count)
+            except IntegrityError:
+                self._files.filter(name=name).update(refs=F("refs") + count)
+
+    def delete(self, name):
+        """Снимает одну ссылку; файл удаляется вместе с последней."""
+        if not is_addressed(name):
+            return
+        with transaction.atomic():
+            if self._files.filter(name=name, refs__gt=1).update(
+                refs=F("refs") - 1
+            ):
+                return
+            deleted, _ = self._files.filter(name=name).delete()
+            if deleted:
+                super().delete(name)
+
+    def delete_legacy(self, name):
+        """Удаляет файл со старым именем (после migrate_media)."""
+        if not is_addressed(name):
+            super().delete(name)
+
+    def references(self, name):
+        return self._files.filter(name=name).values_list(
+            "refs", flat=True
+        ).first() or 0
+
+
+post_images = ContentAddressedStorage()
@@ -0,0 +1,59 @@
+from django import template
+
+from posts.cache import feed_key, get_or_render
+from posts.cards import fill_edit_links
+from posts.pagecache import depend
+
+
+register = template.Library()
+
+
+class FeedCacheNode(template.Node):
+    def __init__(self, nodelist, fragment_name, vary_on):
+        self.nodelist = nodelist
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        request = context.get("request")
+
+        def render():
+            # Фрагмент общий для всех посетителей: вместо ссылок для
+            # автора в нём метки, их заполняет fill_edit_links
+            with context.push(in_feedcache=True):
+                if request is None:
+                    return self.nodelist.render(context), []
+                # Зависимости карточек сохраняются вместе с фрагментом,
+                # чтобы страница из posts.pagecache получила их и при
+                # попадании
+                outer = getattr(request, "_page_deps", None)
+                request._page_deps = set()
+                try:
+                    return (self.nodelist.render(context),
+                            sorted(request._page_deps))
+                finally:
+                    request._page_deps = outer
+
+        content, deps = get_or_render(
+            feed_key(self.fragment_name, vary_on), render
+        )
+        depend(request, *deps)
+        return fill_edit_links(content, context.get("user"))
+
+
+@register.tag
+def feedcache(parser, token):
+    """Кэширует фрагмент ленты до изменения постов или комментариев.
+
+    {% feedcache index_page request.GET.page %} ... {% endfeedcache %}
+    """
+    nodelist = parser.parse(("endfeedcache",))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 2:
+        raise template.TemplateSyntaxError(
+            f"{tokens[0]!r} tag requires a fragment name"
+        )
+    return FeedCacheNode(nodelist, tokens[1],
+                         [parser.compile_filter(t) for t in tokens[2:]])
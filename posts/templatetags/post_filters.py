@@ -0,0 +1,51 @@
+from django import template
+
+from posts.cards import edit_link as render_edit_link, get_cards
+from posts.pagecache import depend, post_dependencies
+from posts.paginator import encode_cursor, page_window
+
+
+register = template.Library()
+
+
+@register.filter
+def cursor(obj, field="pub_date"):
+    return encode_cursor(obj, field)
+
+
+@register.filter
+def window(page):
+    return page_window(page)
+
+
+@register.simple_tag(takes_context=True)
+def prefetch_cards(context, posts):
+    """Достаёт карточки всех постов страницы одним запросом к кэшу;
+    post_card затем берёт их отсюда."""
+    request = context.get("request")
+    cards = get_cards(list(posts))
+    if request is not None:
+        request._post_cards = {**getattr(request, "_post_cards", {}),
+                               **cards}
+    return ""
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post):
+    """(начало, конец) кэшированной карточки поста; страница из кэша
+    posts.pagecache заодно начинает зависеть от поста."""
+    request = context.get("request")
+    card = getattr(request, "_post_cards", {}).get(post.pk)
+    if card is None:
+        card = get_cards([post])[post.pk]
+    if request is not None:
+        depend(request, *post_dependencies(post))
+    return card
+
+
+@register.simple_tag(takes_context=True)
+def edit_link(context, post):
+    """Ссылка «Редактировать» для автора; внутри {% feedcache %} —
+    метка, которую заполняет уже сам feedcache."""
+    return render_edit_link(post, context.get("user"),
+                            deferred=context.get("in_feedcache", False))
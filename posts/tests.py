@@ -1,10 +1,38 @@
-from django.test import TestCase, Client
+from django.apps import apps
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import TestCase, Client, RequestFactory
+from django.core.paginator import Paginator
 from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
 from django.urls import reverse
 from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, models
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from io import BytesIO, StringIO
+from unittest import mock
+import importlib
+import multiprocessing
 import os
+import tempfile
+import threading
 
-from .models import Post, Group, Comment
+from .models import (Post, Group, Comment, Follow, TimelineEntry,
+                     UserStats)
+from .conditional import conditional, index_scopes
+from .forms import PostForm
+from .cache import bump_feed_version, feed_key, get_or_render, touch
+from .paginator import (decode_cursor, encode_cursor, encode_position,
+                        page_window)
+from . import (auth, profiling, replicas, search, sqlite_cache,
+               thumbnails, timeline, timing, views)
+from .db import base as sqlite_backend
+from .sqlite_cache import SQLiteCache
 from PIL import Image
 
 
@@ -130,15 +158,31 @@ class TestProfile(TestCase):
         cache.clear()
         response = self.client.get(reverse('index'))
         self.assertIn('test2', response.content.decode())
+        # изменение в обход сигналов кэш не сбрасывает (версия карточки
+        # поднимается вручную, чтобы проверить только кэш ленты)
+        Post.objects.filter(text='test2').update(
+            text='test2 changed', card_version=models.F('card_version') + 1
+        )
+        response = self.client.get(reverse('index'))
+        self.assertNotIn('test2 changed', response.content.decode())
+        # новый пост сбрасывает кэш лент
         self.post = self.client.post(reverse('new_post'), {
                                                             'text': 'test3',
                                                             'group': 1
                                                           })
         response = self.client.get(reverse('index'))
-        self.assertNotIn('test3', response.content.decode())
-        cache.clear()
-        response = self.client.get(reverse('index'))
         self.assertIn('test3', response.content.decode())
+        self.assertIn('test2 changed', response.content.decode())
+
+    def test_cache_index_pages_differ(self):
+        for i in range(10):
+            Post.objects.create(text=f'filler {i}', author=self.user)
+        cache.clear()
+        first = self.client.get(reverse('index')).content.decode()
+        second = self.client.get(reverse('index'), {'page': 2}).content
+        self.assertIn('filler 9', first)
+        self.assertNotIn('filler 9', second.decode())
+        self.assertIn('No fate', second.decode())
 
 # Неавторизованный посетитель не может опубликовать пост
 # (его редиректит на страницу входа)
@@ -213,6 +257,7 @@ class TestProfile(TestCase):
         self.assertEqual(Comment.objects.all().count(), 0)
 
 
+@override_settings(THUMBNAIL_WORKERS=0)
 class TestImages(TestCase):
     def setUp(self):
         self.client = Client()
@@ -267,3 +312,1456 @@ class TestImages(TestCase):
                                         )
             errors = 'Отправленный файл пуст.'
             self.assertFormError(response, 'form', 'image', errors)
+
+
+class TestCursorPagination(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='sarah', email='s.conor@mail.ru', password='234567Abc'
+        )
+        for i in range(25):
+            Post.objects.create(text=f'post {i}', author=self.user)
+        cache.clear()
+
+    def test_cursor_walk(self):
+        response = self.client.get(reverse('index'))
+        page = response.context['page']
+        self.assertEqual(page[0].text, 'post 24')
+        after = encode_cursor(page[len(page) - 1])
+        response = self.client.get(reverse('index'), {'after': after})
+        page = response.context['page']
+        self.assertEqual(
+            [post.text for post in page],
+            [f'post {i}' for i in range(14, 4, -1)]
+        )
+        self.assertTrue(page.has_next())
+        self.assertTrue(page.has_previous())
+        before = encode_cursor(page[0])
+        response = self.client.get(reverse('index'), {'before': before})
+        page = response.context['page']
+        self.assertEqual(page[0].text, 'post 24')
+        self.assertFalse(page.has_previous())
+
+    def test_last_page(self):
+        last = Post.objects.order_by('pub_date', 'id')[4]
+        response = self.client.get(reverse('index'),
+                                   {'after': encode_cursor(last)})
+        page = response.context['page']
+        self.assertEqual(len(page), 4)
+        self.assertFalse(page.has_next())
+
+    def test_legacy_page_and_bad_cursor(self):
+        response = self.client.get(reverse('index'), {'page': 3})
+        self.assertEqual(response.context['page'][0].text, 'post 4')
+        response = self.client.get(reverse('index'), {'after': 'garbage'})
+        self.assertEqual(response.context['page'][0].text, 'post 24')
+
+    def test_cursor_with_huge_id(self):
+        last = Post.objects.order_by('pub_date', 'id')[4]
+        after = encode_position(last.pub_date, 2 ** 64)
+        self.assertIsNone(decode_cursor(after))
+        response = self.client.get(reverse('index'), {'after': after})
+        self.assertEqual(response.context['page'][0].text, 'post 24')
+
+
+class TestFeedQueries(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='sarah', email='s.conor@mail.ru', password='234567Abc'
+        )
+        self.reader = User.objects.create_user(
+            username='john', email='j.conor@mail.ru', password='123456Abc'
+        )
+        self.group = Group.objects.create(title='test_group',
+                                          slug='test_group',
+                                          description='test')
+        Follow.objects.create(user=self.reader, author=self.user)
+        self.client.force_login(self.reader)
+
+    def add_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(text=f'post {i}', author=self.user,
+                                       group=self.group)
+            Comment.objects.create(post=post, author=self.reader, text='hi')
+
+    def assert_constant_queries(self, url):
+        self.add_posts(1)
+        self.client.get(url)
+        cache.clear()
+        with CaptureQueriesContext(connection) as single:
+            self.client.get(url)
+        self.add_posts(9)
+        cache.clear()
+        with CaptureQueriesContext(connection) as full:
+            response = self.client.get(url)
+        self.assertGreater(len(response.context['page']), 1)
+        self.assertEqual(len(single), len(full))
+        self.assertContains(response, '1 комментариев')
+
+    def test_index_queries(self):
+        self.assert_constant_queries(reverse('index'))
+
+    def test_group_queries(self):
+        self.assert_constant_queries(reverse('group_posts',
+                                             args=[self.group.slug]))
+
+    def test_profile_queries(self):
+        self.assert_constant_queries(reverse('profile',
+                                             args=[self.user.username]))
+
+    def test_follow_queries(self):
+        self.assert_constant_queries(reverse('follow_index'))
+
+
+class TestTimeline(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='sarah')
+        self.reader = User.objects.create_user(username='john')
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def feed(self):
+        response = self.client.get(reverse('follow_index'))
+        return [post.text for post in response.context['page']]
+
+    def test_follow_backfills_and_unfollow_clears(self):
+        Post.objects.create(text='old', author=self.author)
+        self.client.get(reverse('profile_follow',
+                                args=[self.author.username]))
+        Post.objects.create(text='new', author=self.author)
+        self.assertEqual(self.feed(), ['new', 'old'])
+        self.client.get(reverse('profile_unfollow',
+                                args=[self.author.username]))
+        self.assertEqual(self.feed(), [])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    @override_settings(TIMELINE_LENGTH=3)
+    def test_timeline_is_capped(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        other = User.objects.create_user(username='kyle')
+        Follow.objects.create(user=other, author=self.author)
+        for i in range(5):
+            Post.objects.create(text=f'post {i}', author=self.author)
+        self.assertEqual(self.feed(), ['post 4', 'post 3', 'post 2'])
+        self.assertEqual(TimelineEntry.objects.filter(user=other).count(), 3)
+
+    @override_settings(TIMELINE_LENGTH=3, TIMELINE_TRIM_INLINE=1)
+    def test_popular_author_trimmed_by_command(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        other = User.objects.create_user(username='kyle')
+        Follow.objects.create(user=other, author=self.author)
+        for i in range(5):
+            Post.objects.create(text=f'post {i}', author=self.author)
+        self.assertEqual(TimelineEntry.objects.count(), 10)
+        call_command('trim_timelines', stdout=StringIO())
+        self.assertEqual(self.feed(), ['post 4', 'post 3', 'post 2'])
+        self.assertEqual(TimelineEntry.objects.filter(user=other).count(), 3)
+
+    @override_settings(TIMELINE_LENGTH=2)
+    def test_migration_fills_timelines(self):
+        migration = importlib.import_module(
+            'posts.migrations.0006_timelineentry'
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        for i in range(3):
+            Post.objects.create(text=f'post {i}', author=self.author)
+        TimelineEntry.objects.all().delete()
+        migration.fill_timelines(apps, connection.schema_editor())
+        self.assertEqual(self.feed(), ['post 2', 'post 1'])
+
+    def test_fan_out_query_count(self):
+        """Публикация не обрезает ленты подписчиков по одной."""
+        for i in range(20):
+            follower = User.objects.create_user(username=f'reader{i}')
+            Follow.objects.create(user=follower, author=self.author)
+        post = Post.objects.create(text='post', author=self.author)
+        TimelineEntry.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            timeline.fan_out(post)
+        self.assertEqual(TimelineEntry.objects.count(), 20)
+        # Подписчики, вставка и одна обрезка всех их лент
+        self.assertEqual(len(queries), 3)
+
+    def test_rebuild_command(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.create(text='post', author=self.author)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.feed(), ['post'])
+
+    @override_settings(TIMELINE_LENGTH=3)
+    def test_rebuild_merges_authors(self):
+        other = User.objects.create_user(username='kyle')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.reader, author=other)
+        for i in range(3):
+            Post.objects.create(text=f'sarah {i}', author=self.author)
+            Post.objects.create(text=f'kyle {i}', author=other)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.feed(), ['kyle 2', 'sarah 2', 'kyle 1'])
+
+
+class TestUserStats(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='sarah')
+        self.reader = User.objects.create_user(username='john')
+        Post.objects.create(text='first', author=self.author)
+
+    def stats(self, user):
+        return UserStats.objects.for_user(user)
+
+    def test_counters_follow_changes(self):
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        post = Post.objects.create(text='second', author=self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.stats(self.author).posts_count, 2)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).followings_count, 1)
+        post.delete()
+        Follow.objects.filter(user=self.reader).delete()
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).followings_count, 0)
+
+    def test_bump_creates_missing_row(self):
+        UserStats.objects.all().delete()
+        Post.objects.create(text='second', author=self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(stats.posts_count, 2)
+        self.assertEqual(stats.followers_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 2)
+        self.assertEqual(self.stats(self.reader).followings_count, 1)
+
+    def test_profile_uses_stats(self):
+        self.stats(self.author)
+        UserStats.objects.filter(user=self.author).update(posts_count=7)
+        response = self.client.get(reverse('profile',
+                                           args=[self.author.username]))
+        self.assertEqual(response.context['posts_count'], 7)
+
+    def test_reconcile_command(self):
+        self.stats(self.author)
+        UserStats.objects.filter(user=self.author).update(posts_count=42)
+        call_command('reconcile_stats', stdout=StringIO())
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.reader).posts_count, 0)
+
+
+class TestQueryPlans(TestCase):
+    """Каждый запрос лент и страниц поста должен идти по индексу:
+    без полного просмотра таблиц и без сортировки во временном B-дереве."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='sarah')
+        self.reader = User.objects.create_user(username='john')
+        self.group = Group.objects.create(title='test_group',
+                                          slug='test_group',
+                                          description='test')
+        Follow.objects.create(user=self.reader, author=self.author)
+        for i in range(3):
+            self.post = Post.objects.create(text=f'post {i}',
+                                            author=self.author,
+                                            group=self.group)
+            Comment.objects.create(post=self.post, author=self.reader,
+                                   text='hi')
+        UserStats.objects.for_user(self.author)
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def plan(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assert_indexed(self, url, params=None):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, params)
+        statements = [query['sql'] for query in queries
+                      if query['sql'].startswith('SELECT')]
+        self.assertTrue(statements)
+        for sql in statements:
+            # sql из CaptureQueriesContext уже с подставленными значениями
+            for step in self.plan(sql, ()):
+                self.assertNotIn('TEMP B-TREE', step, sql)
+                if step.startswith('SCAN ') and 'subquery' not in step:
+                    self.assertIn('INDEX', step, sql)
+
+    def test_index(self):
+        self.assert_indexed(reverse('index'))
+        self.assert_indexed(reverse('index'),
+                            {'after': encode_cursor(self.post)})
+        self.assert_indexed(reverse('index'),
+                            {'before': encode_cursor(self.post)})
+
+    def test_group(self):
+        self.assert_indexed(reverse('group_posts', args=[self.group.slug]))
+        self.assert_indexed(reverse('group_posts', args=[self.group.slug]),
+                            {'after': encode_cursor(self.post)})
+
+    def test_profile(self):
+        self.assert_indexed(reverse('profile', args=[self.author.username]))
+        self.assert_indexed(reverse('profile', args=[self.author.username]),
+                            {'after': encode_cursor(self.post)})
+
+    def test_post_view(self):
+        self.assert_indexed(reverse('post', args=[self.author.username,
+                                                  self.post.id]))
+
+    def test_follow(self):
+        self.assert_indexed(reverse('follow_index'))
+        self.assert_indexed(reverse('follow_index'),
+                            {'after': encode_cursor(self.post)})
+
+
+class TestFeedCache(TestCase):
+    def test_fresh_entry_is_served_from_cache(self):
+        calls = []
+
+        def render():
+            calls.append(1)
+            return 'html'
+
+        self.assertEqual(get_or_render('test:key', render, 60), 'html')
+        self.assertEqual(get_or_render('test:key', render, 60), 'html')
+        self.assertEqual(len(calls), 1)
+
+    def test_stale_entry_is_served_while_locked(self):
+        cache.set('test:stale', (0, 'old'), 60)
+        cache.add('test:stale:lock', 1, 60)
+        self.assertEqual(get_or_render('test:stale', lambda: 'new', 60),
+                         'old')
+        cache.delete('test:stale:lock')
+        self.assertEqual(get_or_render('test:stale', lambda: 'new', 60),
+                         'new')
+
+    def test_version_bump_changes_key(self):
+        key = feed_key('index_page', [None])
+        bump_feed_version()
+        self.assertNotEqual(key, feed_key('index_page', [None]))
+
+    def test_index_fragment_has_no_viewer_markup(self):
+        """Фрагмент ленты общий: ссылка на правку — только автору,
+        кто бы ни заполнил кэш первым."""
+        cache.clear()
+        author = User.objects.create_user(username='sarah')
+        reader = User.objects.create_user(username='john')
+        Post.objects.create(text='No fate', author=author)
+        self.assertNotContains(Client().get(reverse('index')),
+                               'Редактировать')
+        self.client.force_login(author)
+        self.assertContains(self.client.get(reverse('index')),
+                            'Редактировать', count=1)
+
+        bump_feed_version()
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Редактировать', count=1)
+        self.assertNotContains(response, 'edit-link:')
+        self.client.force_login(reader)
+        self.assertNotContains(self.client.get(reverse('index')),
+                               'Редактировать')
+        # Страница для анонимов тоже устарела, фрагмент — нет
+        touch('posts')
+        self.assertNotContains(Client().get(reverse('index')),
+                               'Редактировать')
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class TestThumbnails(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='sarah')
+        self.path = os.path.join(settings.MEDIA_ROOT, 'posts', 'thumb.jpg')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        Image.new('RGB', (100, 200)).save(self.path)
+        self.post = Post.objects.create(text='with image', author=self.user,
+                                        image='posts/thumb.jpg')
+        cache.clear()
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_placeholder_until_generated(self):
+        Post.objects.create(text='same image', author=self.user,
+                            image='posts/thumb.jpg')
+        urls = [reverse('index'), reverse('profile', args=['sarah'])]
+        for url in urls:
+            self.assertContains(self.client.get(url), 'data:image/svg+xml')
+        self.assertIsNone(thumbnails.cached_thumbnail(self.post.image))
+        out = StringIO()
+        call_command('generate_thumbnails', workers=1, stdout=out)
+        self.assertIn('Создано миниатюр: 1,', out.getvalue())
+        thumbnail = thumbnails.cached_thumbnail(self.post.image)
+        self.assertIsNotNone(thumbnail)
+        # Страницы из кэша с заглушкой сброшены
+        for url in urls:
+            response = self.client.get(url)
+            self.assertContains(response, thumbnail.url, count=2)
+            self.assertNotContains(response, 'data:image/svg+xml')
+
+    def test_edit_schedules_thumbnail(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('post_edit',
+                                 args=[self.user.username, self.post.id]),
+                         {'text': 'edited'})
+        self.assertIsNotNone(thumbnails.cached_thumbnail(self.post.image))
+
+    @override_settings(THUMBNAIL_WORKERS=1)
+    def test_schedule_uses_pool(self):
+        done = threading.Event()
+        threads = []
+
+        def process(post_id, name, ingest):
+            threads.append(threading.current_thread().name)
+            done.set()
+
+        with mock.patch('posts.thumbnails.process', process):
+            thumbnails.schedule(self.post)
+            self.assertTrue(done.wait(5))
+        self.assertTrue(threads[0].startswith('thumbnails'))
+
+
+class TestSearch(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='sarah')
+        self.post = Post.objects.create(text='Терминатор вернётся',
+                                        author=self.user)
+        self.other = Post.objects.create(text='Совсем другой пост',
+                                         author=self.user)
+        Comment.objects.create(post=self.other, author=self.user,
+                               text='Про терминатора <b>тоже</b>')
+        cache.clear()
+
+    def found(self, query):
+        response = self.client.get(reverse('search'), {'q': query})
+        return response, [post.text for post in response.context['page']]
+
+    def test_search_posts_and_comments(self):
+        response, texts = self.found('терминат')
+        self.assertEqual(sorted(texts), sorted([self.post.text,
+                                                self.other.text]))
+        self.assertContains(response, '<mark>Терминатор</mark>')
+        self.assertContains(response, '&lt;b&gt;тоже&lt;/b&gt;')
+
+    def test_index_follows_edits_and_deletes(self):
+        self.post.text = 'Аста ла виста'
+        self.post.save()
+        self.assertEqual(self.found('аста')[1], ['Аста ла виста'])
+        self.post.delete()
+        self.assertEqual(self.found('аста')[1], [])
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(self.found('" OR NEAR(')[1], [])
+        self.assertEqual(len(self.found('терми\x00нат')[1]), 2)
+        self.assertEqual(self.found('\x00\x02')[1], [])
+
+    def test_admin_and_rebuild(self):
+        Post.objects.filter(pk=self.post.pk).update(text='Скайнет')
+        self.assertFalse(Post.objects.filter(
+            pk__in=search.matching(search.POST_TABLE, 'скайнет')
+        ).exists())
+        call_command('rebuild_search_index', stdout=StringIO())
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.client.force_login(admin)
+        response = self.client.get('/admin/posts/post/', {'q': 'скайнет'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [Post.objects.get(pk=self.post.pk)])
+
+
+class TestPageWindow(TestCase):
+    def window(self, number, count=1000):
+        return page_window(Paginator(range(count), 10).page(number))
+
+    def test_window(self):
+        self.assertEqual(self.window(1, 30), [1, 2, 3])
+        self.assertEqual(self.window(1), [1, 2, 3, None, 100])
+        self.assertEqual(self.window(50),
+                         [1, None, 48, 49, 50, 51, 52, None, 100])
+        self.assertEqual(self.window(100), [1, None, 98, 99, 100])
+
+    def test_paginator_renders_window_and_caches_count(self):
+        user = User.objects.create_user(username='sarah')
+        Post.objects.bulk_create(
+            [Post(text=f'post {i}', author=user) for i in range(200)]
+        )
+        cache.clear()
+        response = self.client.get(reverse('index'), {'page': 10})
+        self.assertContains(response, '?page=20"')
+        self.assertNotContains(response, '?page=15"')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('index'), {'page': 11})
+        self.assertFalse([query for query in queries
+                          if 'COUNT(*)' in query['sql']])
+
+    def test_count_survives_comments(self):
+        user = User.objects.create_user(username='sarah')
+        Post.objects.bulk_create(
+            [Post(text=f'post {i}', author=user) for i in range(200)]
+        )
+        cache.clear()
+        self.client.get(reverse('index'))
+        Comment.objects.create(text='comment', author=user,
+                               post=Post.objects.first())
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('index'))
+        self.assertFalse([query for query in queries
+                          if 'COUNT(*)' in query['sql']])
+        Post.objects.create(text='post 200', author=user)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, '?page=21"')
+
+
+class TestGenerateData(TestCase):
+    def test_generate_data(self):
+        call_command('generate_data', users=30, groups=3, posts=200,
+                     comments=100, follows=60, images=0.5, stdout=StringIO())
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Post.objects.count(), 200)
+        name = Post.objects.exclude(image='').exclude(
+            image__isnull=True
+        ).values_list('image', flat=True).first()
+        self.assertEqual(
+            Post._meta.get_field('image').storage.references(name),
+            Post.objects.filter(image=name).count()
+        )
+        self.assertEqual(Comment.objects.count(), 100)
+        self.assertEqual(Follow.objects.count(), 60)
+        self.assertFalse(Follow.objects.filter(
+            user=models.F('author')
+        ).exists())
+        self.assertTrue(TimelineEntry.objects.exists())
+        post = Post.objects.annotate(
+            counted=models.Count('comments')
+        ).order_by('-counted').first()
+        self.assertEqual(post.comments_count, post.counted)
+        author = Post.objects.values('author').annotate(
+            n=models.Count('pk')
+        ).order_by('-n').first()
+        self.assertEqual(
+            UserStats.objects.for_user(
+                User.objects.get(pk=author['author'])
+            ).posts_count,
+            author['n']
+        )
+        self.assertEqual(len(search.search('пост', 5)), 5)
+
+    def test_no_rebuild(self):
+        out = StringIO()
+        call_command('generate_data', users=10, groups=1, posts=50,
+                     comments=10, follows=20, no_rebuild=True, stdout=out)
+        self.assertEqual(Post.objects.count(), 50)
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertIn('rebuild_timelines', out.getvalue())
+        self.assertNotIn('ленты', out.getvalue().splitlines()[-1])
+
+
+class TestServerTiming(TestCase):
+    def test_header_and_histograms(self):
+        user = User.objects.create_user(username='sarah')
+        post = Post.objects.create(text='post', author=user)
+        response = self.client.get(
+            reverse('post', args=[user.username, post.pk])
+        )
+        phases = dict(
+            part.split(';', 1)[0:2]
+            for part in response['Server-Timing'].split(', ')
+        )
+        self.assertEqual(
+            set(phases), {'db', 'tpl', 'cache', 'thumb', 'app', 'total'}
+        )
+        self.assertRegex(phases['db'], r'desc="[1-9]\d* queries"')
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(SERVER_TIMING_DIR=directory):
+                timing.histograms.flush()
+                out = StringIO()
+                call_command('dump_timings', view='post', stdout=out)
+        self.assertIn('post', out.getvalue())
+        self.assertIn('total', out.getvalue())
+
+
+class TestProfiling(TestCase):
+    def test_profiled_request_and_merge(self):
+        user = User.objects.create_user(username='sarah')
+        for i in range(30):
+            Post.objects.create(text=f'post {i}', author=user)
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(PROFILING_DIR=directory,
+                                   PROFILING_INTERVAL=0.0002):
+                for _ in range(3):
+                    cache.clear()
+                    self.client.get(reverse('profile', args=['sarah']),
+                                    HTTP_X_PROFILE='1')
+                self.client.get(reverse('index'))
+                out = StringIO()
+                call_command('merge_profiles', stdout=out)
+                self.assertNotIn('index', out.getvalue())
+                merged = os.path.join(directory, 'merged', 'profile.folded')
+                stacks = profiling.read_stacks(merged)
+        self.assertTrue(stacks)
+        self.assertTrue(any('template:profile.html' in stack
+                            for stack in stacks))
+        self.assertTrue(all(stack.split(';')[-1] for stack in stacks))
+
+
+def _increment(cache_backend, times):
+    for _ in range(times):
+        cache_backend.incr('counter')
+
+
+class TestSQLiteCache(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_cache(self, name='cache', max_entries=1000):
+        return SQLiteCache(
+            os.path.join(self.directory.name, f'{name}.sqlite3'),
+            {'OPTIONS': {'MAX_ENTRIES': max_entries}}
+        )
+
+    def test_get_set_add_delete(self):
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('key', {'a': [1, 2]})
+        self.assertEqual(self.cache.get('key'), {'a': [1, 2]})
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.assertTrue(self.cache.add('new', 'value'))
+        self.cache.set('old', 1, timeout=0)
+        self.assertTrue(self.cache.add('old', 2))
+        self.assertEqual(self.cache.get('old'), 2)
+        self.cache.delete('key')
+        self.assertEqual(self.cache.get('key', 'default'), 'default')
+
+    def test_versions_and_bulk(self):
+        self.cache.set('key', 'v1', version=1)
+        self.cache.set('key', 'v2', version=2)
+        self.assertEqual(self.cache.get('key', version=1), 'v1')
+        self.assertEqual(self.cache.get('key', version=2), 'v2')
+        self.cache.set_many({f'k{i}': i for i in range(600)})
+        found = self.cache.get_many([f'k{i}' for i in range(601)])
+        self.assertEqual(len(found), 600)
+        self.assertEqual(found['k599'], 599)
+        self.cache.delete_many(['k0', 'k1'])
+        self.assertFalse(self.cache.has_key('k0'))
+
+    def test_incr_is_atomic_across_processes(self):
+        self.cache.set('counter', 0)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_increment,
+                                   args=(self.cache, 50))
+                   for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+        self.assertEqual(self.cache.decr('counter', 10), 190)
+
+    def test_cull(self):
+        small = self.make_cache('small', max_entries=50)
+        for i in range(200):
+            small.set(f'k{i}', i)
+        count = len(small.get_many([f'k{i}' for i in range(200)]))
+        self.assertLessEqual(count, 50 + sqlite_cache.CULL_EVERY)
+
+
+class TestConditionalGet(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='sarah')
+        self.group = Group.objects.create(title='g', slug='g',
+                                          description='g')
+        self.other = Group.objects.create(title='o', slug='o',
+                                          description='o')
+        self.post = Post.objects.create(text='post', author=self.author,
+                                        group=self.group)
+
+    def assert_revalidates(self, url, change):
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_index_new_post(self):
+        self.assert_revalidates(reverse('index'), lambda: Post.objects.create(
+            text='new', author=self.author
+        ))
+
+    def test_group_post_moved_away(self):
+        def move():
+            self.post.group = self.other
+            self.post.save()
+        self.assert_revalidates(reverse('group_posts', args=['g']), move)
+
+    def test_post_comment(self):
+        url = reverse('post', args=['sarah', self.post.pk])
+        self.assert_revalidates(url, lambda: Comment.objects.create(
+            post=self.post, author=self.author, text='c'
+        ))
+
+    def test_profile_follow(self):
+        reader = User.objects.create_user(username='john')
+        self.assert_revalidates(
+            reverse('profile', args=['sarah']),
+            lambda: Follow.objects.create(user=reader, author=self.author)
+        )
+
+    def test_group_rename(self):
+        def rename():
+            self.group.title = 'renamed'
+            self.group.save()
+        self.assert_revalidates(reverse('index'), rename)
+        self.assert_revalidates(reverse('profile', args=['sarah']), rename)
+
+    def test_last_modified_for_anonymous_only(self):
+        url = reverse('profile', args=['sarah'])
+        response = self.client.get(url)
+        modified = response['Last-Modified']
+        self.assertEqual(self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=modified
+        ).status_code, 304)
+        self.client.force_login(self.author)
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertEqual(self.client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']
+        ).status_code, 304)
+
+    def test_unknown_author_is_404(self):
+        response = self.client.get(reverse('profile', args=['nobody']))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class TestComments(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='sarah')
+        self.post = Post.objects.create(text='post', author=self.author)
+        readers = [User.objects.create_user(username=f'reader{i}')
+                   for i in range(3)]
+        Comment.objects.bulk_create([
+            Comment(post=self.post, author=readers[i % 3], text=f'c{i}')
+            for i in range(120)
+        ])
+
+    def texts(self, items):
+        return [comment.text for comment in items]
+
+    def test_first_page_and_fragments(self):
+        url = reverse('post', args=['sarah', self.post.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertLess(len(queries), 15)
+        items = response.context['items']
+        self.assertEqual(self.texts(items), [f'c{i}' for i in range(50)])
+        self.assertContains(response, 'data-fragment=')
+
+        after = encode_cursor(items[-1], 'created')
+        fragment = reverse('post_comments', args=['sarah', self.post.pk])
+        response = self.client.get(fragment, {'after': after})
+        items = response.context['items']
+        self.assertEqual(self.texts(items), [f'c{i}' for i in range(50, 100)])
+
+        after = encode_cursor(items[-1], 'created')
+        response = self.client.get(fragment, {'after': after})
+        self.assertEqual(self.texts(response.context['items']),
+                         [f'c{i}' for i in range(100, 120)])
+        self.assertNotContains(response, 'Показать ещё')
+
+    def test_fragment_checks_author(self):
+        response = self.client.get(
+            reverse('post_comments', args=['reader0', self.post.pk])
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class TestApi(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='sarah')
+        self.reader = User.objects.create_user(username='john',
+                                               password='234567Abc')
+        self.group = Group.objects.create(title='T', slug='t')
+        for i in range(25):
+            Post.objects.create(text=f'post {i}', author=self.author,
+                                group=self.group if i % 2 else None)
+        self.post = Post.objects.latest('pk')
+
+    def walk(self, url, params=None):
+        """Все id, собранные по ссылкам next."""
+        ids = []
+        response = self.client.get(url, params)
+        while True:
+            data = response.json()
+            ids += [item['id'] for item in data['results']]
+            if data['next'] is None:
+                return ids
+            response = self.client.get(data['next'])
+
+    def test_posts_pages_cover_feed(self):
+        ids = self.walk(reverse('api:posts'), {'limit': 10})
+        self.assertEqual(ids, list(
+            Post.objects.order_by('-pub_date', '-id')
+            .values_list('id', flat=True)
+        ))
+
+    def test_previous_link(self):
+        first = self.client.get(reverse('api:posts'), {'limit': 10}).json()
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNone(back['previous'])
+
+    def test_sparse_fields_single_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('api:posts'),
+                                       {'fields': 'id,author,group'})
+        items = response.json()['results']
+        self.assertEqual(set(items[0]), {'id', 'author', 'group'})
+        self.assertEqual(items[0]['author'], 'sarah')
+        self.assertEqual(len([q for q in queries
+                              if 'posts_post' in q['sql']]), 1)
+
+    def test_unknown_field(self):
+        response = self.client.get(reverse('api:posts'),
+                                   {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+
+    def test_group_and_author_feeds(self):
+        ids = self.walk(reverse('api:group_posts', args=['t']))
+        self.assertEqual(len(ids), 12)
+        ids = self.walk(reverse('api:author_posts', args=['sarah']))
+        self.assertEqual(len(ids), 25)
+        for url in (reverse('api:group_posts', args=['missing']),
+                    reverse('api:author_posts', args=['nobody'])):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertIn('error', response.json())
+
+    def test_follow_feed(self):
+        url = reverse('api:follow_posts')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client.login(username='john', password='234567Abc')
+        self.assertEqual(len(self.walk(url, {'limit': 7})), 25)
+
+    def test_image_url_from_field_storage(self):
+        Post.objects.filter(pk=self.post.pk).update(image='posts/a.jpg')
+        storage = Post._meta.get_field('image').storage
+        with mock.patch.object(storage, 'base_url', '/images/'):
+            data = self.client.get(reverse('api:post',
+                                           args=[self.post.pk])).json()
+        self.assertEqual(data['image'], '/images/posts/a.jpg')
+
+    def test_post_detail_and_comments(self):
+        Comment.objects.bulk_create([
+            Comment(post=self.post, author=self.reader, text=f'c{i}')
+            for i in range(5)
+        ])
+        data = self.client.get(reverse('api:post',
+                                       args=[self.post.pk])).json()
+        self.assertEqual(data['text'], 'post 24')
+        self.assertIsNone(data['image'])
+        response = self.client.get(reverse('api:comments',
+                                           args=[self.post.pk]),
+                                   {'limit': 2, 'fields': 'text'})
+        data = response.json()
+        self.assertEqual([c['text'] for c in data['results']], ['c0', 'c1'])
+        data = self.client.get(data['next']).json()
+        self.assertEqual([c['text'] for c in data['results']], ['c2', 'c3'])
+        response = self.client.get(reverse('api:post', args=[10 ** 6]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_conditional_get(self):
+        url = reverse('api:posts')
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(text='new', author=self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class TestSyndication(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='sarah')
+        self.group = Group.objects.create(title='Cats', slug='cats',
+                                          description='d')
+        Post.objects.create(text='in group', author=self.author,
+                            group=self.group)
+        Post.objects.create(text='no group', author=self.author)
+
+    def test_feeds(self):
+        cases = [
+            (reverse('index_rss'), ['in group', 'no group']),
+            (reverse('index_atom'), ['in group', 'no group']),
+            (reverse('group_rss', args=['cats']), ['in group']),
+            (reverse('group_atom', args=['cats']), ['in group']),
+            (reverse('author_rss', args=['sarah']), ['in group', 'no group']),
+            (reverse('author_atom', args=['sarah']),
+             ['in group', 'no group']),
+        ]
+        for url, texts in cases:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('xml', response['Content-Type'])
+                for text in texts:
+                    self.assertContains(response, text)
+        response = self.client.get(reverse('group_rss', args=['dogs']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_snapshot_and_conditional_get(self):
+        url = reverse('group_atom', args=['cats'])
+        response = self.client.get(url)
+        etag = response['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            repeated = self.client.get(url)
+        self.assertEqual(repeated.content, response.content)
+        self.assertFalse([q for q in queries if 'posts_post' in q['sql']])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Post.objects.create(text='fresh', author=self.author,
+                            group=self.group)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'fresh')
+
+    def test_pages_link_feeds(self):
+        response = self.client.get(reverse('group_posts', args=['cats']))
+        self.assertContains(response,
+                            reverse('group_rss', args=['cats']))
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class TestImageIngestion(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='sarah')
+        self.client.force_login(self.user)
+        self.names = []
+        cache.clear()
+
+    def tearDown(self):
+        for name in self.names:
+            default_storage.delete(name)
+
+    def upload(self, size, **save_options):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'JPEG', **save_options)
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue(),
+                                  content_type='image/jpeg')
+
+    def test_new_post_image_is_processed(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: повернуть на 90°
+        exif[0x010f] = 'Camera'
+        self.client.post(reverse('new_post'), {
+            'text': 'photo', 'image': self.upload((3000, 1000), exif=exif)
+        })
+        post = Post.objects.get(text='photo')
+        self.names.append(post.image.name)
+        self.assertEqual((post.image_width, post.image_height), (683, 2048))
+        with default_storage.open(post.image.name) as stored:
+            image = Image.open(stored)
+            self.assertEqual(image.size, (683, 2048))
+            self.assertFalse(image.getexif())
+        self.assertIsNotNone(thumbnails.cached_thumbnail(post.image))
+
+    @override_settings(IMAGE_MAX_PIXELS=100)
+    def test_form_rejects_huge_images(self):
+        form = PostForm({'text': 'photo'},
+                        {'image': self.upload((20, 20))})
+        self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
+
+    def test_process_images_command(self):
+        name = default_storage.save('posts/old.jpg', self.upload((2500, 50)))
+        self.names.append(name)
+        post = Post.objects.create(text='old', author=self.user, image=name)
+        out = StringIO()
+        call_command('process_images', workers=1, stdout=out)
+        self.assertIn('Обработано картинок: 1', out.getvalue())
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (2048, 41))
+        out = StringIO()
+        call_command('process_images', workers=1, stdout=out)
+        self.assertIn('Обработано картинок: 0', out.getvalue())
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class TestContentAddressedStorage(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='sarah')
+        self.client.force_login(self.user)
+        self.storage = Post._meta.get_field('image').storage
+        buffer = BytesIO()
+        Image.new('RGB', (30, 20), 'blue').save(buffer, 'PNG')
+        self.content = buffer.getvalue()
+        cache.clear()
+
+    def test_identical_uploads_share_file(self):
+        for text in ('first', 'second'):
+            self.client.post(reverse('new_post'), {
+                'text': text,
+                'image': SimpleUploadedFile('a.png', self.content),
+            })
+        first, second = Post.objects.order_by('pk')
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertRegex(name, r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/'
+                               r'[0-9a-f]{64}\.png$')
+        self.assertEqual(self.storage.references(name), 2)
+
+        first.delete()
+        self.assertTrue(self.storage.exists(name))
+        second.image = None
+        second.save()
+        self.assertFalse(self.storage.exists(name))
+        self.assertEqual(self.storage.references(name), 0)
+
+    def test_same_image_uploaded_again(self):
+        post = Post.objects.create(
+            text='post', author=self.user,
+            image=SimpleUploadedFile('a.png', self.content)
+        )
+        name = post.image.name
+        post.image = SimpleUploadedFile('b.png', self.content)
+        post.save()
+        self.assertEqual(post.image.name, name)
+        self.assertEqual(self.storage.references(name), 1)
+        post.text = 'edited'
+        post.save()
+        self.assertEqual(self.storage.references(name), 1)
+        post.delete()
+        self.assertFalse(self.storage.exists(name))
+
+    def test_migrate_media(self):
+        legacy = default_storage.save('posts/legacy.png',
+                                      ContentFile(self.content))
+        for text in ('first', 'second'):
+            Post.objects.create(text=text, author=self.user, image=legacy)
+        out = StringIO()
+        call_command('migrate_media', '--delete-old', stdout=out)
+        self.assertIn('Перенесено файлов: 1', out.getvalue())
+        names = set(Post.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertNotEqual(name, legacy)
+        self.assertEqual(self.storage.references(name), 2)
+        self.assertFalse(default_storage.exists(legacy))
+        self.assertIsNotNone(thumbnails.cached_thumbnail(name))
+        Post.objects.all().delete()
+        self.assertFalse(self.storage.exists(name))
+
+
+class TestPageCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='sarah')
+        self.other = User.objects.create_user(username='john',
+                                              password='234567Abc')
+        self.cats = Group.objects.create(title='Cats', slug='cats')
+        self.dogs = Group.objects.create(title='Dogs', slug='dogs')
+        self.post = Post.objects.create(text='cat post', author=self.author,
+                                        group=self.cats)
+        Post.objects.create(text='dog post', author=self.other,
+                            group=self.dogs)
+
+    def cached(self, url):
+        """True, если анонимный ответ пришёл из кэша (без шаблонов)."""
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.context is None
+
+    def warm(self, *urls):
+        for url in urls:
+            self.cached(url)
+            self.assertTrue(self.cached(url))
+
+    def test_anonymous_pages_cached_users_fresh(self):
+        url = reverse('index')
+        self.assertFalse(self.cached(url))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(self.cached(url))
+        self.assertFalse([q for q in queries if 'posts_post' in q['sql']])
+        self.client.login(username='john', password='234567Abc')
+        self.assertFalse(self.cached(url))
+        self.assertFalse(self.cached(url))
+
+    def test_edit_purges_only_dependent_pages(self):
+        cats = reverse('group_posts', args=['cats'])
+        dogs = reverse('group_posts', args=['dogs'])
+        sarah = reverse('profile', args=['sarah'])
+        john = reverse('profile', args=['john'])
+        post = reverse('post', args=['sarah', self.post.pk])
+        self.warm(cats, dogs, sarah, john, post)
+        self.post.text = 'edited'
+        self.post.save()
+        for url in (cats, sarah, post):
+            self.assertFalse(self.cached(url), url)
+        for url in (dogs, john):
+            self.assertTrue(self.cached(url), url)
+
+    def test_comments_follows_and_group_renames(self):
+        post = reverse('post', args=['sarah', self.post.pk])
+        sarah = reverse('profile', args=['sarah'])
+        index = reverse('index')
+        self.warm(post, sarah, index)
+        Comment.objects.create(post=self.post, author=self.other, text='hi')
+        self.assertFalse(self.cached(post))
+        self.warm(sarah)
+        Follow.objects.create(user=self.other, author=self.author)
+        self.assertFalse(self.cached(sarah))
+        self.warm(index)
+        self.cats.title = 'Kittens'
+        self.cats.save()
+        response = self.client.get(index)
+        self.assertContains(response, 'Kittens')
+
+
+class TestPostCards(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='sarah',
+                                               password='234567Abc')
+        self.reader = User.objects.create_user(username='john',
+                                               password='234567Abc')
+        self.group = Group.objects.create(title='Cats', slug='cats')
+        for i in range(5):
+            Post.objects.create(text=f'post {i}', author=self.author,
+                                group=self.group)
+        self.url = reverse('group_posts', args=['cats'])
+
+    def test_cards_fetched_in_one_round_trip(self):
+        self.client.login(username='john', password='234567Abc')
+        self.client.get(self.url)
+        with mock.patch('posts.cards.cache', wraps=cache) as spy, \
+                mock.patch('posts.cards.render_card') as render:
+            response = self.client.get(self.url)
+        self.assertEqual(spy.get_many.call_count, 1)
+        render.assert_not_called()
+        self.assertContains(response, 'post 4')
+
+    def test_edit_link_outside_cached_card(self):
+        self.client.login(username='john', password='234567Abc')
+        self.assertNotContains(self.client.get(self.url), 'Редактировать')
+        self.client.login(username='sarah', password='234567Abc')
+        with mock.patch('posts.cards.render_card') as render:
+            response = self.client.get(self.url)
+        render.assert_not_called()
+        self.assertContains(response, 'Редактировать', count=5)
+        # На главной карточки ещё и внутри общего фрагмента ленты
+        self.assertContains(self.client.get(reverse('index')),
+                            'Редактировать', count=5)
+        self.client.login(username='john', password='234567Abc')
+        self.assertNotContains(self.client.get(reverse('index')),
+                               'Редактировать')
+
+    def test_plain_save_keeps_counters(self):
+        """Объект из памяти не затирает счётчики, выросшие после его
+        загрузки, и правка не прячется за старой версией карточки."""
+        post = Post.objects.get(text='post 0')
+        Comment.objects.create(post=post, author=self.reader, text='hi')
+        self.client.get(self.url)
+        post.text = 'edited'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(post.card_version, 2)
+        response = self.client.get(self.url)
+        self.assertContains(response, 'edited')
+        self.assertContains(response, '1 комментариев')
+
+    def test_version_bumps(self):
+        post = Post.objects.filter(text='post 0').get()
+
+        def version():
+            return Post.objects.values_list(
+                'card_version', flat=True
+            ).get(pk=post.pk)
+
+        start = version()
+        post.text = 'edited'
+        post.save()
+        self.assertEqual(version(), start + 1)
+        Comment.objects.create(post=post, author=self.reader, text='hi')
+        self.assertEqual(version(), start + 2)
+        self.group.title = 'Kittens'
+        self.group.save()
+        self.assertEqual(version(), start + 3)
+        self.client.login(username='john', password='234567Abc')
+        response = self.client.get(self.url)
+        self.assertContains(response, '#Kittens', count=5)
+        self.assertContains(response, 'edited')
+        self.assertContains(response, '1 комментариев')
+
+    def test_author_rename(self):
+        self.assertContains(Client().get(reverse('index')), '@sarah',
+                            count=5)
+        self.author.username = 'connor'
+        self.author.save()
+        response = Client().get(reverse('index'))
+        self.assertNotContains(response, '@sarah')
+        self.assertContains(response, 'href="/connor/"', count=5)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class TestReplicaRouting(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = replicas.ReplicaRouter()
+
+    def run_view(self, request, view, write=False):
+        """Куда пошло бы чтение внутри view и ответ middleware."""
+        seen = {}
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            if write:
+                self.router.db_for_write(Post)
+            seen['read'] = self.router.db_for_read(Post)
+            return HttpResponse()
+
+        middleware = replicas.ReplicaMiddleware(get_response)
+        response = middleware(request)
+        return seen['read'], response
+
+    def test_read_only_views_use_replica(self):
+        db, response = self.run_view(self.factory.get('/'), views.index)
+        self.assertEqual(db, 'replica1')
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        db, _ = self.run_view(self.factory.get('/new/'), views.new_post)
+        self.assertEqual(db, 'default')
+        db, _ = self.run_view(self.factory.post('/'), views.index)
+        self.assertEqual(db, 'default')
+
+    def test_write_pins_to_primary(self):
+        db, response = self.run_view(self.factory.get('/'), views.index,
+                                     write=True)
+        self.assertEqual(db, 'default')
+        cookie = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+        request = self.factory.get('/')
+        request.COOKIES[settings.REPLICA_PIN_COOKIE] = '1'
+        db, _ = self.run_view(request, views.index)
+        self.assertEqual(db, 'default')
+
+    def test_state_is_per_request(self):
+        self.run_view(self.factory.get('/'), views.index)
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_migrations_only_on_primary(self):
+        self.assertFalse(self.router.allow_migrate('replica1', 'posts'))
+        self.assertTrue(self.router.allow_migrate('default', 'posts'))
+
+    def test_sessions_and_users_read_primary(self):
+        replicas.use_replica()
+        self.addCleanup(replicas.reset)
+        self.assertEqual(self.router.db_for_read(User), 'default')
+        self.assertEqual(self.router.db_for_read(Session), 'default')
+        self.assertEqual(self.router.db_for_read(Post), 'replica1')
+
+    def test_cache_fills_read_primary(self):
+        """В общие кэши не попадают данные с отстающей реплики."""
+        replicas.use_replica()
+        self.addCleanup(replicas.reset)
+        cache.delete('test:replica')
+        db = get_or_render('test:replica',
+                           lambda: self.router.db_for_read(Post), 60)
+        self.assertEqual(db, 'default')
+        self.assertFalse(replicas.used())
+
+    def test_replica_response_has_no_validators(self):
+        @conditional(index_scopes)
+        def view(request):
+            self.router.db_for_read(Post)
+            return HttpResponse()
+
+        request = self.factory.get('/')
+        request.user = User(pk=1)
+        replicas.use_replica()
+        self.addCleanup(replicas.reset)
+        response = view(request)
+        self.assertNotIn('ETag', response)
+        replicas.reset()
+        del request._last_changed
+        self.assertIn('ETag', view(request))
+
+    def test_new_post_sets_pin_cookie(self):
+        user = User.objects.create_user(username='sarah')
+        self.client.force_login(user)
+        response = self.client.post(reverse('new_post'), {'text': 'hi'})
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+
+class TestSQLiteBackend(TestCase):
+    def test_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -64 * 1024)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_write_queue_is_bounded(self):
+        queue = sqlite_backend.WriteQueue(size=0)
+        queue.acquire(timeout=1)
+        with self.assertRaises(sqlite_backend.WriteQueueFull):
+            queue.acquire(timeout=1)
+        queue.size = 1
+        with self.assertRaises(sqlite_backend.WriteQueueFull):
+            queue.acquire(timeout=0.05)
+        queue.release()
+        queue.acquire(timeout=0.05)
+        queue.release()
+
+    def test_write_views_are_atomic(self):
+        """Запись из view и всё, что пишут её сигналы, идут одной
+        транзакцией (в тесте — точкой сохранения)."""
+        author = User.objects.create_user(username='sarah')
+        reader = User.objects.create_user(username='john')
+        Follow.objects.create(user=reader, author=author)
+        Follow.objects.create(user=author, author=reader)
+        self.client.force_login(author)
+        post = Post.objects.create(text='post', author=author)
+        requests = [
+            lambda: self.client.post(reverse('new_post'), {'text': 'hi'}),
+            lambda: self.client.post(
+                reverse('add_comment', args=['sarah', post.pk]),
+                {'text': 'comment'}
+            ),
+            lambda: self.client.get(reverse('profile_unfollow',
+                                            args=['john'])),
+        ]
+        for request in requests:
+            with CaptureQueriesContext(connection) as queries:
+                request()
+            depth, outside = 0, []
+            for query in queries.captured_queries:
+                sql = query['sql']
+                if sql.startswith('SAVEPOINT'):
+                    depth += 1
+                elif sql.startswith('RELEASE SAVEPOINT'):
+                    depth -= 1
+                elif depth == 0 and sql.startswith(
+                    ('INSERT', 'UPDATE', 'DELETE')
+                ):
+                    outside.append(sql)
+            self.assertEqual(outside, [])
+
+    def test_concurrent_read_modify_write(self):
+        """Транзакции, которые читают и потом пишут, не падают с
+        «database is locked», даже из многих потоков."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_dict = dict(connection.settings_dict,
+                             NAME=os.path.join(directory.name, 'db.sqlite3'))
+        setup = sqlite_backend.DatabaseWrapper(settings_dict)
+        with setup.cursor() as cursor:
+            cursor.execute('CREATE TABLE counter (value INTEGER)')
+        setup.close()
+        errors = []
+
+        def work():
+            wrapper = sqlite_backend.DatabaseWrapper(settings_dict)
+            try:
+                for _ in range(20):
+                    wrapper.ensure_connection()
+                    wrapper._start_transaction_under_autocommit()
+                    with wrapper.cursor() as cursor:
+                        cursor.execute(
+                            'SELECT COALESCE(MAX(value), 0) FROM counter'
+                        )
+                        value = cursor.fetchone()[0] + 1
+                        cursor.execute('INSERT INTO counter VALUES (%s)',
+                                       [value])
+                    wrapper.commit()
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                wrapper.close()
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        check = sqlite_backend.DatabaseWrapper(settings_dict)
+        with check.cursor() as cursor:
+            cursor.execute('SELECT COUNT(DISTINCT value), MAX(value) '
+                           'FROM counter')
+            self.assertEqual(cursor.fetchone(), (160, 160))
+        check.close()
+
+
+class TestCachedAuth(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='kyle',
+                                             password='skynet-1984')
+        self.client.login(username='kyle', password='skynet-1984')
+
+    def auth_queries(self, path=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path or reverse('new_post'))
+        found = [query['sql'] for query in queries.captured_queries
+                 if 'FROM "django_session"' in query['sql']
+                 or query['sql'].startswith('SELECT "auth_user"."id"')]
+        return response, found
+
+    def test_session_and_user_from_cache(self):
+        self.auth_queries()
+        response, found = self.auth_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['user'], self.user)
+        self.assertEqual(found, [])
+
+    def test_user_change_invalidates_cache(self):
+        self.auth_queries()
+        self.user.first_name = 'Kyle'
+        self.user.save()
+        response, found = self.auth_queries()
+        self.assertEqual(len(found), 1)
+        self.assertEqual(response.context['user'].first_name, 'Kyle')
+
+    def test_password_change_logs_out(self):
+        self.auth_queries()
+        self.user.set_password('judgment-day')
+        self.user.save()
+        response, _ = self.auth_queries()
+        self.assertRedirects(response, reverse('login') + '?next='
+                             + reverse('new_post'))
+
+    def test_stale_cached_user_logs_out(self):
+        self.auth_queries()
+        # Запись в кэше осталась от другого пароля
+        User.objects.filter(pk=self.user.pk).update(password='!')
+        cache.set(auth.user_key(self.user.pk),
+                  User.objects.get(pk=self.user.pk))
+        response, _ = self.auth_queries()
+        self.assertEqual(response.status_code, 302)
+
+    def test_anonymous_reader_has_no_session(self):
+        client = Client()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse('index'))
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertFalse(any('django_session' in query['sql']
+                             for query in queries.captured_queries))
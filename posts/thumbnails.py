@@ -0,0 +1,119 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from sorl.thumbnail import default, delete, get_thumbnail
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.conf import defaults as thumbnail_defaults
+from sorl.thumbnail.images import ImageFile
+
+from . import images, timing
+from .signals import post_changed
+
+
+logger = logging.getLogger(__name__)
+
+# Размер и параметры миниатюры карточки поста (include/post_item.html)
+FEED_GEOMETRY = "960x339"
+FEED_OPTIONS = {"crop": "center", "upscale": True}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _thumbnail_file(name, geometry, options):
+    """Файл миниатюры с тем же именем, что построит sorl.get_thumbnail."""
+    backend = default.backend
+    source = ImageFile(name)
+    options = dict(options)
+    if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault("format", backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(thumbnail_settings, attr)
+        if value != getattr(thumbnail_defaults, attr):
+            options.setdefault(key, value)
+    filename = backend._get_thumbnail_filename(source, geometry, options)
+    return ImageFile(filename, default.storage)
+
+
+@timing.timed("thumb")
+def cached_thumbnail(name):
+    """Готовая миниатюра или None. Сама ничего не генерирует."""
+    if not name:
+        return None
+    return default.kvstore.get(
+        _thumbnail_file(str(name), FEED_GEOMETRY, FEED_OPTIONS)
+    )
+
+
+@timing.timed("thumb")
+def generate(name):
+    try:
+        get_thumbnail(name, FEED_GEOMETRY, **FEED_OPTIONS)
+    except Exception:
+        logger.exception("Не удалось создать миниатюру для %s", name)
+        return False
+    return True
+
+
+def generate_in_thread(name):
+    """generate() для потоков пула: соединения с БД потока закрываются."""
+    try:
+        return generate(name)
+    finally:
+        connections.close_all()
+
+
+def process(post_id, name, ingest=True):
+    """Обработка картинки поста, затем миниатюра уже из неё."""
+    if ingest:
+        processed = images.ingest_post(post_id, name)
+        if processed is None:
+            return False
+        if processed == name:
+            # Миниатюры и размеры оригинала в sorl могли остаться от
+            # необработанного файла
+            delete(name, delete_file=False)
+        name = processed
+    if not generate(name):
+        return False
+    # Страницы, закэшированные с заглушкой, должны получить миниатюру
+    post_changed(post_id)
+    return True
+
+
+def process_in_thread(post_id, name, ingest=True):
+    try:
+        return process(post_id, name, ingest)
+    finally:
+        connections.close_all()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix="thumbnails",
+            )
+    return _executor
+
+
+def schedule(post, ingest=True):
+    """Ставит обработку картинки поста (posts.images, если ingest) и
+    генерацию миниатюры в фоновый пул.
+
+    При THUMBNAIL_WORKERS = 0 миниатюра создаётся сразу, в текущем потоке.
+    """
+    if not post.image:
+        return
+    if not settings.THUMBNAIL_WORKERS:
+        process(post.pk, post.image.name, ingest)
+        return
+    _get_executor().submit(process_in_thread, post.pk, post.image.name,
+                           ingest)
@@ -0,0 +1,147 @@
+import heapq
+from itertools import groupby, islice
+from operator import itemgetter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+
+from .models import Post, Follow, TimelineEntry
+
+
+User = get_user_model()
+
+
+def timeline_length():
+    return settings.TIMELINE_LENGTH
+
+
+def trim(user_id):
+    """Оставляет в ленте пользователя только TIMELINE_LENGTH свежих постов."""
+    boundary = TimelineEntry.objects.filter(user_id=user_id).order_by(
+        "-pub_date", "-post_id"
+    ).values_list("pub_date", "post_id")[timeline_length():][:1]
+    boundary = list(boundary)
+    if not boundary:
+        return
+    pub_date, post_id = boundary[0]
+    TimelineEntry.objects.filter(
+        user_id=user_id, pub_date__lte=pub_date
+    ).exclude(pub_date=pub_date, post_id__gt=post_id).delete()
+
+
+def trim_all(users=None):
+    """trim() для всех лент (или лент users) одним DELETE; возвращает
+    число удалённых строк. Номер строки в ленте считает оконная функция
+    по индексу (user, pub_date, post)."""
+    table = TimelineEntry._meta.db_table
+    where, params = "", []
+    if users is not None:
+        user_ids = [getattr(user, "pk", user) for user in users]
+        if not user_ids:
+            return 0
+        where = f"WHERE user_id IN ({', '.join(['%s'] * len(user_ids))})"
+        params = user_ids
+    sql = (
+        f"DELETE FROM {table} WHERE id IN ("
+        f"SELECT id FROM (SELECT id, ROW_NUMBER() OVER ("
+        f"PARTITION BY user_id ORDER BY pub_date DESC, post_id DESC"
+        f") AS position FROM {table} {where}) WHERE position > %s)"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, timeline_length()])
+        return cursor.rowcount
+
+
+def fan_out(post):
+    """Раскладывает новый пост в ленты всех подписчиков автора.
+
+    Если подписчиков не больше TIMELINE_TRIM_INLINE, их ленты тут же
+    обрезаются одним trim_all. Обрезка читает каждую ленту целиком,
+    поэтому ленты подписчиков популярных авторов обрезает только
+    manage.py trim_timelines по расписанию; до того они лишь длиннее
+    TIMELINE_LENGTH.
+    """
+    follower_ids = list(Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list("user_id", flat=True))
+    TimelineEntry.objects.bulk_create([
+        TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+        for user_id in follower_ids
+    ], ignore_conflicts=True)
+    if follower_ids and len(follower_ids) <= settings.TIMELINE_TRIM_INLINE:
+        trim_all(follower_ids)
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту последние посты автора после подписки."""
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        "-pub_date", "-id"
+    ).values_list("id", "pub_date")[:timeline_length()]
+    TimelineEntry.objects.bulk_create([
+        TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for post_id, pub_date in posts
+    ], ignore_conflicts=True)
+    trim(user_id)
+
+
+def remove(user_id, author_id):
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+@transaction.atomic
+def rebuild(users=None, batch_size=1000):
+    """Пересобирает ленты с нуля по таблице Follow. Возвращает число
+    записанных строк.
+
+    Свежие посты каждого автора читаются один раз по индексу
+    (author, pub_date), а ленты читателей собираются слиянием этих
+    списков. Строк получается до TIMELINE_LENGTH на читателя, поэтому
+    они пишутся executemany без создания объектов модели.
+    """
+    follows = Follow.objects.all()
+    if users is None:
+        TimelineEntry.objects.all().delete()
+    else:
+        TimelineEntry.objects.filter(user__in=users).delete()
+        follows = follows.filter(user__in=users)
+    follows = follows.order_by("user_id").values_list("user_id", "author_id")
+    limit = timeline_length()
+    adapt = connection.ops.adapt_datetimefield_value
+    latest = {}
+
+    def author_posts(author_id):
+        if author_id not in latest:
+            latest[author_id] = [
+                (pub_date, post_id, adapt(pub_date))
+                for pub_date, post_id in Post.objects.filter(
+                    author_id=author_id
+                ).order_by("-pub_date", "-id").values_list(
+                    "pub_date", "id"
+                )[:limit]
+            ]
+        return latest[author_id]
+
+    sql = (f"INSERT INTO {TimelineEntry._meta.db_table} "
+           f"(user_id, post_id, pub_date) VALUES (%s, %s, %s)")
+    created = 0
+    rows = []
+    with connection.cursor() as cursor:
+        for user_id, follows_of_user in groupby(
+            follows.iterator(chunk_size=batch_size), key=itemgetter(0)
+        ):
+            merged = heapq.merge(*(author_posts(author_id)
+                                   for _, author_id in follows_of_user),
+                                 reverse=True)
+            rows.extend((user_id, post_id, pub_date)
+                        for _, post_id, pub_date in islice(merged, limit))
+            if len(rows) >= batch_size:
+                cursor.executemany(sql, rows)
+                created += len(rows)
+                rows = []
+        if rows:
+            cursor.executemany(sql, rows)
+            created += len(rows)
+    return created
@@ -0,0 +1,286 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+from .sqlite_cache import SQLiteCache
+
+
+logger = logging.getLogger(__name__)
+
+# Фазы запроса в заголовке Server-Timing. Время фаз «собственное»:
+# SQL внутри рендеринга шаблона идёт в db, а не в tpl; app — всё
+# остальное время view и middleware.
+PHASES = ("db", "tpl", "cache", "thumb")
+# Верхние границы корзин гистограмм, мс
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000,
+           float("inf"))
+
+_local = threading.local()
+
+
+class Timings:
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._children = []
+
+    @contextmanager
+    def measure(self, phase):
+        self._children.append(0.0)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            children = self._children.pop()
+            self.durations[phase] += elapsed - children
+            self.counts[phase] += 1
+            if self._children:
+                self._children[-1] += elapsed
+
+
+def current():
+    """Замеры текущего запроса или None вне запроса."""
+    return getattr(_local, "timings", None)
+
+
+@contextmanager
+def measure(phase):
+    timings = current()
+    if timings is None:
+        yield
+        return
+    with timings.measure(phase):
+        yield
+
+
+def timed(phase):
+    """Декоратор: вызов функции засчитывается в фазу phase."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with measure(phase):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with measure("tpl"):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Шаблонизатор Django, засекающий рендеринг для Server-Timing."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+class TimedCacheMixin:
+    """Засекает обращения к кэшу и считает попадания get()."""
+
+    _miss = object()
+
+    def get(self, key, default=None, version=None):
+        with measure("cache"):
+            value = super().get(key, self._miss, version)
+        timings = current()
+        if value is self._miss:
+            if timings is not None:
+                timings.cache_misses += 1
+            return default
+        if timings is not None:
+            timings.cache_hits += 1
+        return value
+
+    def get_many(self, keys, version=None):
+        with measure("cache"):
+            return super().get_many(keys, version)
+
+    def set(self, *args, **kwargs):
+        with measure("cache"):
+            return super().set(*args, **kwargs)
+
+    def add(self, *args, **kwargs):
+        with measure("cache"):
+            return super().add(*args, **kwargs)
+
+    def set_many(self, *args, **kwargs):
+        with measure("cache"):
+            return super().set_many(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with measure("cache"):
+            return super().delete(*args, **kwargs)
+
+    def incr(self, *args, **kwargs):
+        with measure("cache"):
+            return super().incr(*args, **kwargs)
+
+
+class TimedLocMemCache(TimedCacheMixin, LocMemCache):
+    pass
+
+
+class TimedSQLiteCache(TimedCacheMixin, SQLiteCache):
+    pass
+
+
+def _execute(execute, sql, params, many, context):
+    with measure("db"):
+        return execute(sql, params, many, context)
+
+
+class Histograms:
+    """Гистограммы времени фаз по view; сбрасываются в файл процесса
+    SERVER_TIMING_DIR/<pid>.json, откуда их собирает dump_timings."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = {}
+        self.flushed = time.monotonic()
+
+    def add(self, view, values):
+        with self.lock:
+            phases = self.data.setdefault(view, {})
+            for phase, ms in values.items():
+                row = phases.setdefault(phase, {
+                    "count": 0, "sum": 0.0, "buckets": [0] * len(BUCKETS)
+                })
+                row["count"] += 1
+                row["sum"] += ms
+                row["buckets"][bisect_left(BUCKETS, ms)] += 1
+            due = (time.monotonic() - self.flushed
+                   >= settings.SERVER_TIMING_FLUSH_INTERVAL)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self.flushed = time.monotonic()
+            payload = json.dumps(self.data)
+        directory = settings.SERVER_TIMING_DIR
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        with open(f"{path}.tmp", "w") as file:
+            file.write(payload)
+        os.replace(f"{path}.tmp", path)
+
+    def reset(self):
+        with self.lock:
+            self.data = {}
+
+
+histograms = Histograms()
+
+
+def load_histograms():
+    """Сумма гистограмм всех процессов из SERVER_TIMING_DIR."""
+    merged = {}
+    directory = settings.SERVER_TIMING_DIR
+    if not os.path.isdir(directory):
+        return merged
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(directory, name)) as file:
+            data = json.load(file)
+        for view, phases in data.items():
+            for phase, row in phases.items():
+                total = merged.setdefault(view, {}).setdefault(phase, {
+                    "count": 0, "sum": 0.0, "buckets": [0] * len(BUCKETS)
+                })
+                total["count"] += row["count"]
+                total["sum"] += row["sum"]
+                total["buckets"] = [a + b for a, b in
+                                    zip(total["buckets"], row["buckets"])]
+    return merged
+
+
+def percentile(row, fraction):
+    """Верхняя граница корзины, в которую попадает перцентиль."""
+    rank = fraction * row["count"]
+    seen = 0
+    for bound, count in zip(BUCKETS, row["buckets"]):
+        seen += count
+        if count and seen >= rank:
+            return bound
+    return BUCKETS[-1]
+
+
+class ServerTimingMiddleware:
+    """Время SQL, шаблонов, кэша и миниатюр в заголовке Server-Timing,
+    в строке лога posts.timing и в гистограммах по view.
+
+    Должен стоять первым в MIDDLEWARE, чтобы total включал остальные.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = _local.timings = Timings()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(_execute)
+                    )
+                response = self.get_response(request)
+        finally:
+            _local.timings = None
+        total = (time.perf_counter() - started) * 1000
+        values = {phase: timings.durations[phase] * 1000
+                  for phase in PHASES}
+        values["app"] = max(total - sum(values.values()), 0)
+        values["total"] = total
+        response["Server-Timing"] = self.header(timings, values)
+
+        match = request.resolver_match
+        view = match.view_name if match else "unresolved"
+        logger.info(json.dumps({
+            "view": view,
+            "path": request.path,
+            "status": response.status_code,
+            "ms": {phase: round(ms, 2) for phase, ms in values.items()},
+            "queries": timings.counts["db"],
+            "cache_hits": timings.cache_hits,
+            "cache_misses": timings.cache_misses,
+        }))
+        histograms.add(view, values)
+        return response
+
+    def header(self, timings, values):
+        descriptions = {
+            "db": f"{timings.counts['db']} queries",
+            "cache": f"{timings.cache_hits} hits "
+                     f"{timings.cache_misses} misses",
+            "thumb": f"{timings.counts['thumb']} lookups",
+        }
+        parts = []
+        for phase, ms in values.items():
+            part = f"{phase};dur={ms:.1f}"
+            if phase in descriptions:
+                part += f';desc="{descriptions[phase]}"'
+            parts.append(part)
+        return ", ".join(parts)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import feeds, views
 
 
 urlpatterns = [
@@ -7,12 +7,32 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('group/<slug>', views.group_posts, name='group_posts'),
     path('new/', views.new_post, name='new_post'),
+    path('search/', views.post_search, name='search'),
+    path('feeds/rss/', feeds.index_rss, name='index_rss'),
+    path('feeds/atom/', feeds.index_atom, name='index_atom'),
+    path('feeds/group/<slug>/rss/', feeds.group_rss, name='group_rss'),
+    path('feeds/group/<slug>/atom/', feeds.group_atom, name='group_atom'),
+    path(
+            'feeds/author/<str:username>/rss/',
+            feeds.author_rss,
+            name='author_rss'
+        ),
+    path(
+            'feeds/author/<str:username>/atom/',
+            feeds.author_atom,
+            name='author_atom'
+        ),
     path('<str:username>/<int:post_id>/', views.post_view, name='post'),
     path(
             '<str:username>/<int:post_id>/edit/',
             views.post_edit,
             name='post_edit'
         ),
+    path(
+            '<str:username>/<int:post_id>/comments/',
+            views.post_comments,
+            name='post_comments'
+        ),
     path(
             '<username>/<int:post_id>/comment/',
             views.add_comment,
@@ -52,11 +52,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'posts.timing.ServerTimingMiddleware',
+    'posts.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'posts.auth.CachedAuthenticationMiddleware',
+    'posts.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
@@ -67,7 +70,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'posts.timing.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -87,13 +90,50 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# posts.db: SQLite в режиме WAL с очередью писателей; соединения живут
+# между запросами (CONN_MAX_AGE)
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'posts.db',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            # Секунды ожидания блокировки файла другими процессами
+            'timeout': 20,
+            'WRITE_QUEUE_SIZE': 64,
+        },
     }
 }
 
+# Реплики для чтения (posts.replicas). Локально это копии db.sqlite3,
+# их число задаёт YATUBE_REPLICAS, обновляет manage.py sync_replicas.
+DATABASE_REPLICAS = [
+    f'replica{i}'
+    for i in range(1, int(os.environ.get('YATUBE_REPLICAS', 0)) + 1)
+]
+for alias in DATABASE_REPLICAS:
+    DATABASES[alias] = {
+        'ENGINE': 'posts.db',
+        'NAME': os.path.join(BASE_DIR, f'db-{alias}.sqlite3'),
+        # Недолго, чтобы соединения увидели копию после sync_replicas
+        'CONN_MAX_AGE': 60,
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['posts.replicas.ReplicaRouter']
+
+# Страницы, которые читают с реплик
+REPLICA_VIEWS = [
+    'posts.views.index',
+    'posts.views.group_posts',
+    'posts.views.profile',
+    'posts.views.post_view',
+    'posts.views.follow_index',
+    'django.contrib.flatpages.views.flatpage',
+]
+# Сколько секунд после записи посетитель читает только из default
+REPLICA_PIN_SECONDS = 10
+REPLICA_PIN_COOKIE = 'primary'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -142,12 +182,79 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
 SITE_ID = 1
 
+# Общий для всех процессов сервера кэш в файле SQLite (posts.sqlite_cache)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'posts.timing.TimedSQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
     }
 }
 
+# Тесты не трогают кэш и media/ сервера (yatube.testing)
+TEST_RUNNER = 'yatube.testing.IsolatedRunner'
+
+# Кэш лент сбрасывается при изменении постов и комментариев, поэтому
+# срок свежести может быть большим. Устаревшая запись хранится ещё
+# FEED_CACHE_STALE_TIMEOUT секунд, пока один запрос её перерисовывает.
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+FEED_CACHE_STALE_TIMEOUT = 60 * 5
+FEED_CACHE_LOCK_TIMEOUT = 5
+
+# Срок жизни страницы в кэше для анонимов (posts.pagecache); раньше
+# её сбрасывает изменение любого объекта, от которого она зависит
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Срок жизни карточки поста в кэше (posts.cards); при изменении поста
+# меняется её ключ
+CARD_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Записей в RSS/Atom (posts.feeds)
+SYNDICATION_ITEMS = 20
+
+# Сколько секунд хранится число записей ленты для паджинатора
+PAGINATOR_COUNT_TIMEOUT = 60 * 60
+
+# Обработка загруженных картинок (posts.images): длинная сторона,
+# качество JPEG/WebP и предел пикселей, после которого файл отклоняется
+IMAGE_MAX_SIZE = 2048
+IMAGE_QUALITY = 85
+IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+
+# Потоков фоновой обработки картинок и генерации миниатюр; 0 — генерировать сразу в запросе
+THUMBNAIL_WORKERS = 2
+
+# Сколько последних постов хранится в материализованной ленте подписок.
+# Таблица лент растёт до TIMELINE_LENGTH строк на каждого читателя с
+# подписками, и столько же пишет rebuild_timelines
+TIMELINE_LENGTH = 1000
+# Новый пост автора, у которого подписчиков не больше этого числа, сразу
+# обрезает их ленты; остальные обрезает manage.py trim_timelines, его
+# нужно запускать по расписанию (cron, раз в час; см. README)
+TIMELINE_TRIM_INLINE = 500
+
+# Гистограммы Server-Timing: каждый процесс раз в
+# SERVER_TIMING_FLUSH_INTERVAL секунд пишет свой файл в SERVER_TIMING_DIR,
+# manage.py dump_timings их суммирует.
+SERVER_TIMING_DIR = os.path.join(BASE_DIR, "timings")
+SERVER_TIMING_FLUSH_INTERVAL = 10
+
+# Сэмплирующий профайлер (posts.profiling): доля профилируемых запросов,
+# регулярные выражения путей, которые профилируются всегда, и заголовок,
+# включающий профилирование для INTERNAL_IPS и персонала.
+PROFILING_SAMPLE_RATE = 0
+PROFILING_PATHS = []
+PROFILING_HEADER = "X-Profile"
+PROFILING_INTERVAL = 0.002
+PROFILING_DIR = os.path.join(BASE_DIR, "profiles")
+
+# Сессии читаются из кэша, база — запасное хранилище; пользователь
+# сессии тоже кэшируется (posts.auth)
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+AUTH_USER_CACHE_TIMEOUT = 60 * 60
+
 LOGIN_URL = "/auth/login/"
 LOGIN_REDIRECT_URL = "index"
 
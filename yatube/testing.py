@@ -0,0 +1,48 @@
+"""Окружение тестов отдельно от сервера, запущенного из того же каталога.
+
+Тесты очищают кэш и загружают файлы; с настройками по умолчанию это
+общий cache.sqlite3 и media/ работающего сервера. Здесь они и каталог
+замеров направляются во временный каталог, который удаляется после
+прогона: для manage.py test — через TEST_RUNNER, для pytest — через
+conftest.py в корне проекта.
+"""
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class IsolatedEnvironment:
+    def __init__(self, **overrides):
+        self.overrides = overrides
+
+    def enable(self):
+        self.directory = tempfile.mkdtemp(prefix="yatube-test-")
+        cache = dict(settings.CACHES["default"],
+                     LOCATION=os.path.join(self.directory, "cache.sqlite3"))
+        self.settings = override_settings(
+            CACHES={**settings.CACHES, "default": cache},
+            MEDIA_ROOT=os.path.join(self.directory, "media"),
+            SERVER_TIMING_DIR=os.path.join(self.directory, "timings"),
+            PROFILING_DIR=os.path.join(self.directory, "profiles"),
+            **self.overrides,
+        )
+        self.settings.enable()
+
+    def disable(self):
+        self.settings.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class IsolatedRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.environment = IsolatedEnvironment()
+        self.environment.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.environment.disable()
+        super().teardown_test_environment(**kwargs)
@@ -49,6 +49,8 @@ urlpatterns += [
         ),
 ]
 urlpatterns += [
+    # JSON API, до posts: иначе 'api' примет за имя пользователя
+    path('api/v1/', include('posts.api_urls')),
     # импорт из приложения posts
     path('', include('posts.urls')),
 ]